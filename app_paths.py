@@ -0,0 +1,31 @@
+"""Where Vak keeps the files it writes for itself.
+
+The transcript cache and the IPA lexicon used to sit next to the modules.
+In the packaged one-file build that folder is a temporary copy, unpacked
+again on every launch and deleted at exit, so the caches now live in the
+platform's per-user cache folder. Set VAK_CACHE_DIR to put them elsewhere.
+"""
+import os
+import sys
+
+APP_NAME = "Vak"
+
+
+def cache_dir():
+    """The per-user cache folder. Not created here - writers create it
+    when they first need it."""
+    override = os.environ.get("VAK_CACHE_DIR")
+    if override:
+        return override
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+        return os.path.join(base, APP_NAME, "Cache")
+    if sys.platform == "darwin":
+        return os.path.join(os.path.expanduser("~/Library/Caches"), APP_NAME)
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, APP_NAME.lower())
+
+
+def cache_path(name):
+    """Path of the named file in the cache folder."""
+    return os.path.join(cache_dir(), name)
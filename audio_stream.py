@@ -0,0 +1,242 @@
+"""Streaming audio reader and silence-based chunker.
+
+The speech API takes one request per utterance and gives up on long
+recordings, and decoding an hour-long lecture into memory in one go is not
+an option on the worker boxes. Instead the audio is read in blocks and cut
+into chunks of at most CHUNK_MAX_SECONDS, each cut placed at the quietest
+point in the allowed range so words are not split. Only the chunk being
+filled (plus whatever the caller keeps in flight) is ever held in memory.
+
+WAV and AIFF are read through speech_recognition's own file reader;
+everything else is decoded by an ffmpeg subprocess writing 16-bit mono WAV
+to a pipe, which is read as it arrives. That includes FLAC whenever ffmpeg
+is available: speech_recognition reads FLAC by decoding the whole file to
+AIFF in memory first.
+"""
+import contextlib
+import os
+import subprocess
+import wave
+
+import numpy as np
+import speech_recognition as sr
+
+# Formats the speech_recognition library reads natively.
+NATIVE_FORMATS = {'.wav', '.aiff', '.aif', '.flac'}
+
+# Chunk length bounds. The free Web Speech API handles up to about a minute
+# per request; anything shorter than CHUNK_MAX_SECONDS goes as one chunk.
+CHUNK_MAX_SECONDS = 50.0
+CHUNK_MIN_SECONDS = 20.0
+# Loudness is measured over windows this long when choosing a cut point.
+WINDOW_SECONDS = 0.05
+
+
+class PcmStream:
+    """Mono PCM source: sample_rate, sample_width (bytes) and
+    read(frames) -> bytes, returning b'' at the end of the audio."""
+
+    def __init__(self, sample_rate, sample_width, read):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.read = read
+
+
+@contextlib.contextmanager
+def open_stream(path, ffmpeg_exe=None):
+    """Opens path as a PcmStream. ffmpeg_exe (None if ffmpeg isn't
+    available) is required for formats outside NATIVE_FORMATS, and used
+    for FLAC when given."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in NATIVE_FORMATS and not (ext == '.flac' and ffmpeg_exe):
+        with sr.AudioFile(path) as source:
+            # AudioFileStream.read takes a frame count and downmixes to mono.
+            yield PcmStream(source.SAMPLE_RATE, source.SAMPLE_WIDTH, source.stream.read)
+        return
+
+    if not ffmpeg_exe:
+        raise RuntimeError("FFmpeg is required to decode this format")
+    # CREATE_NO_WINDOW keeps a console from flashing up in the windowed
+    # Windows build for every file.
+    flags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+    proc = subprocess.Popen(
+        [ffmpeg_exe, '-nostdin', '-v', 'error', '-i', path,
+         '-vn', '-ac', '1', '-acodec', 'pcm_s16le', '-f', 'wav', '-'],
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL, creationflags=flags)
+    try:
+        try:
+            reader = wave.open(proc.stdout, 'rb')
+        except (EOFError, wave.Error) as e:
+            raise RuntimeError(f"ffmpeg could not decode the file ({e})") from e
+        yield PcmStream(reader.getframerate(), reader.getsampwidth(), reader.readframes)
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+def to_samples(data, sample_width):
+    """Raw little-endian PCM bytes -> float32 array scaled to [-1, 1]."""
+    if sample_width == 1:
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if sample_width == 2:
+        return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+    if sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        value = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        value = np.where(value >= 1 << 23, value - (1 << 24), value)
+        return value.astype(np.float32) / (1 << 23)
+    return np.frombuffer(data, dtype='<i4').astype(np.float32) / (1 << 31)
+
+
+def _quietest_cut(data, sample_width, sample_rate, min_frames):
+    """Frame offset of the quietest window at or after min_frames (the
+    latest one on ties, so chunks come out as long as allowed)."""
+    window = max(1, int(sample_rate * WINDOW_SECONDS))
+    samples = to_samples(data, sample_width)[min_frames:]
+    count = len(samples) // window
+    if count == 0:
+        return len(data) // sample_width
+    energy = np.square(samples[:count * window].reshape(count, window)).mean(axis=1)
+    quietest = count - 1 - int(np.argmin(energy[::-1]))
+    return max(1, min_frames + quietest * window + window // 2)
+
+
+def iter_chunks(stream, max_seconds=CHUNK_MAX_SECONDS, min_seconds=CHUNK_MIN_SECONDS):
+    """Yields the stream as sr.AudioData chunks of at most max_seconds,
+    cut at the quietest point after min_seconds. Audio shorter than
+    max_seconds comes out as a single chunk."""
+    width, rate = stream.sample_width, stream.sample_rate
+    max_frames = max(1, int(max_seconds * rate))
+    min_frames = min(int(min_seconds * rate), max_frames - 1)
+    pending = bytearray()
+
+    while True:
+        data = stream.read(max_frames - len(pending) // width)
+        if not data:
+            break
+        pending += data
+        if len(pending) < max_frames * width:
+            continue
+        cut = _quietest_cut(pending, width, rate, min_frames) * width
+        yield sr.AudioData(bytes(pending[:cut]), rate, width)
+        del pending[:cut]
+
+    if pending:
+        yield sr.AudioData(bytes(pending), rate, width)
+
+
+# Upload preprocessing. Speech recognition gains nothing from content above
+# 8 kHz, so audio is resampled down to 16 kHz, and dead air at either end of
+# a chunk is trimmed off before it is sent.
+TARGET_SAMPLE_RATE = 16000
+TRIM_THRESHOLD_DB = -45.0
+# Kept on either side of the trimmed speech so word onsets aren't clipped.
+TRIM_PADDING_SECONDS = 0.2
+
+
+def _trim(samples, sample_rate, threshold_db):
+    """Drops leading/trailing windows whose RMS is below threshold_db
+    (dBFS). Returns an empty array if no window reaches it."""
+    if len(samples) == 0:
+        return samples
+    window = max(1, min(len(samples), int(sample_rate * WINDOW_SECONDS)))
+    count = len(samples) // window
+    rms = np.sqrt(np.square(samples[:count * window].reshape(count, window)).mean(axis=1))
+    loud = np.flatnonzero(rms >= 10 ** (threshold_db / 20))
+    if len(loud) == 0:
+        return samples[:0]
+    pad = int(sample_rate * TRIM_PADDING_SECONDS)
+    start = max(0, loud[0] * window - pad)
+    end = min(len(samples), (loud[-1] + 1) * window + pad)
+    return samples[start:end]
+
+
+def _resample(samples, source_rate, target_rate):
+    """Linear-interpolation downsampling, preceded by a moving average one
+    output sample wide to keep most content above the new Nyquist limit
+    from aliasing back in."""
+    step = source_rate / target_rate
+    width = int(round(step))
+    if width > 1:
+        samples = np.convolve(samples, np.full(width, 1.0 / width, dtype=np.float32), mode='same')
+    positions = np.arange(int(len(samples) / step)) * step
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def preprocess(audio_data, target_rate=TARGET_SAMPLE_RATE, trim_db=TRIM_THRESHOLD_DB):
+    """Returns a trimmed, downsampled 16-bit copy of a mono sr.AudioData
+    chunk. Audio already at or below target_rate is not resampled; pass
+    trim_db=None to skip trimming. A chunk that is silent throughout comes
+    back empty."""
+    samples = to_samples(audio_data.frame_data, audio_data.sample_width)
+    rate = audio_data.sample_rate
+    if trim_db is not None:
+        samples = _trim(samples, rate, trim_db)
+    if target_rate and rate > target_rate and len(samples):
+        samples = _resample(samples, rate, target_rate)
+        rate = target_rate
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+    return sr.AudioData(pcm, rate, 2)
+
+
+# Pre-screen thresholds. Files shorter than MIN_DURATION_SECONDS, and chunks
+# whose RMS and peak level both stay under these dBFS values, are never sent
+# to the speech API - there is nothing in them it could transcribe.
+MIN_DURATION_SECONDS = 0.1
+SILENCE_RMS_DB = -50.0
+SILENCE_PEAK_DB = -30.0
+# The data size a streaming WAV writer puts in the header.
+_UNKNOWN_DATA_SIZE = 0xFFFFFFFF
+
+
+def _db(value):
+    return 20 * np.log10(max(float(value), 1e-10))
+
+
+def levels(audio_data):
+    """(rms_dbfs, peak_dbfs) of an sr.AudioData chunk."""
+    samples = to_samples(audio_data.frame_data, audio_data.sample_width)
+    if len(samples) == 0:
+        return _db(0), _db(0)
+    return (_db(np.sqrt(np.square(samples).mean())),
+            _db(np.abs(samples).max()))
+
+
+def is_silent(audio_data, rms_db=SILENCE_RMS_DB, peak_db=SILENCE_PEAK_DB):
+    rms, peak = levels(audio_data)
+    return rms < rms_db and peak < peak_db
+
+
+def screen_header(path, min_seconds=MIN_DURATION_SECONDS):
+    """Checks that can be made without decoding any audio. Returns
+    (reason, message) for a file not worth decoding, or None. WAV headers
+    are parsed for duration and truncation; other formats only get the
+    empty-file check, their length is only known once decoded."""
+    if os.path.getsize(path) == 0:
+        return "empty", "File is empty (0 bytes)"
+    if os.path.splitext(path)[1].lower() != '.wav':
+        return None
+
+    try:
+        with wave.open(path, 'rb') as reader:
+            frames, rate = reader.getnframes(), reader.getframerate()
+            frame_size = reader.getsampwidth() * reader.getnchannels()
+    except (EOFError, wave.Error):
+        # wave doesn't read every WAV variant (e.g. float samples) -
+        # leave those to the decoder instead of failing them here.
+        return None
+
+    # Streamed WAVs (ffmpeg's "-f wav -", many recorders) are written before
+    # their length is known and leave 0 or 0xFFFFFFFF in the data size field;
+    # their header says nothing about duration or truncation.
+    if frame_size and frames in (0, _UNKNOWN_DATA_SIZE // frame_size):
+        return None
+    if rate and frames / rate < min_seconds:
+        return "too_short", f"Recording is too short ({frames / rate:.2f} s)"
+    # The header says how much audio follows; a file much smaller than that
+    # was cut off mid-upload or mid-write.
+    if os.path.getsize(path) < frames * frame_size * 0.9:
+        return "truncated", "File is truncated (smaller than its header says)"
+    return None
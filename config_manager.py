@@ -1,51 +1,138 @@
+"""Recently-used field values and settings, persisted in history.json.
+
+The file is read once and then served from memory, so settings can be read
+on hot paths (worker counts, cache sizes) without touching the disk. The
+file's mtime is still checked - at most once per CHECK_SECONDS - so edits
+made by hand or by another instance are picked up.
+
+Writes update memory at once and reach the disk SAVE_DELAY seconds later,
+so a burst of changes (start_drive_processing makes four) is one write.
+Each write goes to a temp file that is then renamed over history.json, so
+a crash mid-write never leaves a truncated file. Pending changes are
+flushed when the interpreter exits.
+"""
+import atexit
 import json
 import os
+import tempfile
+import threading
+import time
 
 _DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json")
 
 
 class ConfigManager:
-    """Persists recently-used field values in a JSON file next to the app."""
+    """Persists recently-used field values in a JSON file next to the app.
+    Safe to share between threads."""
 
     MAX_HISTORY = 10
+    SAVE_DELAY = 0.5
+    CHECK_SECONDS = 1.0
 
     def __init__(self, config_file=_DEFAULT_PATH):
         self.config_file = config_file
+        self._lock = threading.RLock()
+        self._data = {}
+        self._mtime = None
+        self._checked = None    # monotonic time of the last mtime check
+        self._dirty = False
+        self._timer = None
+        atexit.register(self.flush)
 
-    def _load(self):
-        try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError, OSError):
-            return {}
-
-    def _save(self, data):
+    def _file_mtime(self):
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4)
+            return os.stat(self.config_file).st_mtime_ns
         except OSError:
-            pass  # history is a convenience; never crash the app over it
+            return None
+
+    def _load(self):
+        """The in-memory config, reloaded if the file changed on disk.
+        Unsaved changes win over the file. Call with the lock held."""
+        now = time.monotonic()
+        if self._dirty or (self._checked is not None
+                           and now - self._checked < self.CHECK_SECONDS):
+            return self._data
+        self._checked = now
+        mtime = self._file_mtime()
+        if mtime != self._mtime:
+            self._mtime = mtime
+            try:
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._data = data if isinstance(data, dict) else {}
+            except (json.JSONDecodeError, FileNotFoundError, OSError):
+                self._data = {}
+        return self._data
+
+    def _save(self):
+        """Marks the config changed and schedules a write. Call with the
+        lock held."""
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.SAVE_DELAY, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Writes pending changes now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            directory = os.path.dirname(os.path.abspath(self.config_file))
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(prefix=".history-", suffix=".tmp",
+                                                dir=directory)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, indent=4)
+                os.replace(tmp_path, self.config_file)
+                # Our own write must not look like an outside edit.
+                self._mtime = self._file_mtime()
+            except OSError:
+                # history is a convenience; never crash the app over it
+                if tmp_path is not None:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
 
     def add_to_history(self, key, value):
         if not value:
             return
-        data = self._load()
-        history = data.get(key, [])
-        if value in history:
-            history.remove(value)
-        history.insert(0, value)
-        data[key] = history[:self.MAX_HISTORY]
-        self._save(data)
+        with self._lock:
+            data = self._load()
+            history = data.get(key, [])
+            history = list(history) if isinstance(history, list) else []
+            if value in history:
+                history.remove(value)
+            history.insert(0, value)
+            data[key] = history[:self.MAX_HISTORY]
+            self._save()
 
     def get_history(self, key):
-        history = self._load().get(key, [])
-        return history if isinstance(history, list) else []
+        with self._lock:
+            history = self._load().get(key, [])
+            # A copy, so callers can't change the cached config.
+            return list(history) if isinstance(history, list) else []
 
     def set_value(self, key, value):
-        data = self._load()
-        data[key] = value
-        self._save(data)
+        with self._lock:
+            self._load()[key] = value
+            self._save()
 
     def get_value(self, key, default=""):
-        value = self._load().get(key, default)
+        with self._lock:
+            value = self._load().get(key, default)
         return value if isinstance(value, str) else default
+
+    def get_int(self, key, default=0):
+        with self._lock:
+            value = self._load().get(key, default)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return default
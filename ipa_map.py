@@ -1,4 +1,6 @@
 # ipa_map.py
+import re
+from functools import lru_cache
 
 # Refined IPA to Sanskrit (Devanagari) Mapping
 IPA_TO_SANSKRIT = {
@@ -75,92 +77,139 @@ IAST_PHONEMES = sorted([
 ], key=len, reverse=True)
 
 
+# Vowels that fold into the preceding consonant as a dependent sign (matra)
+# instead of being written as an independent letter. अ is the inherent vowel,
+# so it folds to nothing - the virama is simply dropped.
+VOWEL_TO_MATRA = {
+    'अ': '', 'आ': 'ा', 'इ': 'ि', 'ई': 'ी', 'उ': 'ु', 'ऊ': 'ू',
+    'ए': 'े', 'ऐ': 'ै', 'ओ': 'ो', 'औ': 'ौ',
+}
+
+# One compiled alternation over every IPA key, longest first, so the regex
+# engine does the longest-match scan in C instead of re-sorting the table and
+# slicing the input at every position. The trailing (.) group passes any
+# character the table doesn't know through unchanged.
+_IPA_PATTERN = re.compile(
+    '(' + '|'.join(re.escape(k) for k in sorted(IPA_TO_SANSKRIT, key=len, reverse=True))
+    + ')|(.)',
+    re.DOTALL)
+
+
 def ipa_to_sanskrit(ipa_text):
     if not ipa_text:
         return ""
 
-    tokens = []
-    i = 0
-    n = len(ipa_text)
-    sorted_keys = sorted(IPA_TO_SANSKRIT.keys(), key=len, reverse=True)
-    
-    while i < n:
-        match_found = False
-        for key in sorted_keys:
-            if ipa_text[i:].startswith(key):
-                tokens.append(IPA_TO_SANSKRIT[key])
-                i += len(key)
-                match_found = True
-                break
-        if not match_found:
-            tokens.append(ipa_text[i])
-            i += 1
-            
-    VOWEL_TO_MATRA = {
-        'अ': '', 'आ': 'ा', 'इ': 'ि', 'ई': 'ी', 'उ': 'ु', 'ऊ': 'ू',
-        'ए': 'े', 'ऐ': 'ै', 'ओ': 'ो', 'औ': 'ौ',
-    }
-    
-    merged_output = ""
+    output = []
     last_was_halanta = False
-    
-    for token in tokens:
+
+    for match in _IPA_PATTERN.finditer(ipa_text):
+        key, other = match.groups()
+        token = IPA_TO_SANSKRIT[key] if key is not None else other
+
         if last_was_halanta and token in VOWEL_TO_MATRA:
-            if merged_output.endswith(VIRAMA):
-                merged_output = merged_output[:-1]
-            merged_output += VOWEL_TO_MATRA[token]
+            # The previous token ends in a virama: swap it for the matra.
+            output[-1] = output[-1][:-1] + VOWEL_TO_MATRA[token]
             last_was_halanta = False
         else:
-            merged_output += token
-            if token.endswith(VIRAMA):
-                last_was_halanta = True
-            else:
-                last_was_halanta = False
-                
-    return merged_output
+            output.append(token)
+            last_was_halanta = token.endswith(VIRAMA)
 
-def sanskrit_to_iast(text):
-    if not text:
-        return ""
-        
-    iast_output = ""
+    return "".join(output)
+
+
+def ipa_to_sanskrit_many(ipa_texts):
+    """Converts an iterable of IPA strings, returning a list in the same
+    order. Repeated inputs (common in word lists) are converted once."""
+    seen = {}
+    output = []
+    for ipa_text in ipa_texts:
+        sanskrit = seen.get(ipa_text)
+        if sanskrit is None:
+            sanskrit = seen[ipa_text] = ipa_to_sanskrit(ipa_text)
+        output.append(sanskrit)
+    return output
+
+def _iast_pieces(text):
+    """Walks Devanagari text once, yielding the IAST for each unit
+    (consonant + virama/matra/inherent a, independent vowel, or any other
+    character passed through)."""
     i = 0
     n = len(text)
-    
+
     while i < n:
         char = text[i]
-        
+
         if char in CONSONANTS:
             base = CONSONANTS[char]
             next_char = text[i+1] if i + 1 < n else None
-            
-            if next_char:
-                if next_char == VIRAMA:
-                    iast_output += base
-                    i += 2 
-                elif next_char in MATRAS:
-                    iast_output += base + MATRAS[next_char]
-                    i += 2
-                else:
-                    iast_output += base + 'a'
-                    i += 1
+
+            if next_char == VIRAMA:
+                yield base
+                i += 2
+            elif next_char is not None and next_char in MATRAS:
+                yield base + MATRAS[next_char]
+                i += 2
             else:
-                iast_output += base + 'a'
+                yield base + 'a'
                 i += 1
-                
+
         elif char in INDEPENDENT_VOWELS:
-            iast_output += INDEPENDENT_VOWELS[char]
+            yield INDEPENDENT_VOWELS[char]
             i += 1
-            
+
         elif char in MATRAS:
-             iast_output += MATRAS[char]
-             i += 1
-             
+            yield MATRAS[char]
+            i += 1
+
         else:
-            iast_output += char
+            yield char
             i += 1
 
-    return iast_output
+
+# Every IAST phoneme is one or two characters long, so the longest-match
+# split only ever has to look one character ahead: a character either pairs
+# with the next one as a digraph ("bh", "ai", "l̤") or stands alone.
+_IAST_DIGRAPHS = frozenset(p for p in IAST_PHONEMES if len(p) == 2)
+
+
+@lru_cache(maxsize=1024)
+def _split_piece(piece):
+    """Longest-match phoneme split of one short IAST fragment."""
+    output = []
+    i = 0
+    n = len(piece)
+    while i < n:
+        if piece[i:i+2] in _IAST_DIGRAPHS:
+            output.append(piece[i:i+2])
+            i += 2
+        else:
+            output.append(piece[i])
+            i += 1
+    return tuple(output)
+
+
+def _split_phonemes(pieces):
+    """Splits a sequence of IAST fragments into phonemes exactly as if they
+    had been joined and split as one string. The only interaction across a
+    fragment boundary is a trailing single character pairing with the next
+    fragment's first character (e.g. "ka" + "i" -> k,ai)."""
+    output = []
+    for piece in pieces:
+        if not piece:
+            continue
+        if output and len(output[-1]) == 1 and output[-1] + piece[0] in _IAST_DIGRAPHS:
+            output[-1] += piece[0]
+            output.extend(_split_piece(piece[1:]))
+        else:
+            output.extend(_split_piece(piece))
+    return output
+
+
+def sanskrit_to_iast(text):
+    if not text:
+        return ""
+    return "".join(_iast_pieces(text))
+
 
 def get_iast_separated(iast_text):
     """
@@ -169,26 +218,23 @@ def get_iast_separated(iast_text):
     """
     if not iast_text:
         return ""
-    
-    output = []
-    i = 0
-    n = len(iast_text)
-    
-    # IAST_PHONEMES is sorted by length descending
-    
-    while i < n:
-        match_found = False
-        # Try to match largest phoneme at current position
-        for phoneme in IAST_PHONEMES:
-            if iast_text[i:].startswith(phoneme):
-                output.append(phoneme)
-                i += len(phoneme)
-                match_found = True
-                break
-        
-        if not match_found:
-            # If char not in our strict set, keep it as single char (e.g. spaces, commas?)
-            output.append(iast_text[i])
-            i += 1
-            
-    return ",".join(output)
+    return ",".join(_split_phonemes(iast_text))
+
+
+def transliterate(text):
+    """Devanagari -> (IAST string, list of IAST phonemes) in one walk.
+
+    Same output as sanskrit_to_iast() followed by get_iast_separated()
+    (join the list with "," for the separated form), without rescanning
+    the IAST string.
+    """
+    if not text:
+        return "", []
+    pieces = list(_iast_pieces(text))
+    return "".join(pieces), _split_phonemes(pieces)
+
+
+def transliterate_many(texts):
+    """Batch form of transliterate(): a list of (iast, phonemes) tuples in
+    input order."""
+    return [transliterate(text) for text in texts]
@@ -0,0 +1,295 @@
+"""Compact, memory-mapped English -> IPA lexicon.
+
+eng_to_ipa.convert() opens its SQLite dictionary and runs a query on every
+call. Vak instead builds, once, a read-only lexicon file from the same CMU
+data (with eng_to_ipa's own CMU -> IPA rules, so every entry is exactly
+what convert() returns for that word) and memory-maps it:
+
+    header   MAGIC, entry count, source stamp length, source stamp
+    offsets  count + 1 key offsets, then count + 1 value offsets (uint32)
+    keys     UTF-8 words, sorted bytewise, back to back
+    values   UTF-8 IPA strings in key order, back to back
+
+A lookup is a binary search over the mapped keys - nothing is parsed or
+loaded at startup, and several worker processes share the same pages.
+The source stamp records the eng_to_ipa dictionary it was built from; if
+eng_to_ipa is upgraded the file is rebuilt.
+
+Tokens the lexicon can't answer (words outside CMU, bare punctuation) go
+to eng_to_ipa.convert() in one batch, and its answers are kept in a small
+SQLite cache so they are only computed once.
+"""
+import bisect
+import hashlib
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+from array import array
+
+import app_paths
+
+_DEFAULT_PATH = app_paths.cache_path("lexicon.bin")
+_DEFAULT_MISS_PATH = app_paths.cache_path("lexicon_misses.db")
+
+MAGIC = b"VAKLEX1" + (b"L" if sys.byteorder == "little" else b"B")
+_HEADER = struct.Struct("=8sII")
+
+# Characters eng_to_ipa strips from both ends of a word before looking it
+# up (see eng_to_ipa.transcribe.preprocess).
+_PUNCT = '!"#$%&\'()*+,-./:;<=>/?@[\\]^_`{|}~«» '
+# ...and the punctuation it puts back around the result (preserve_punc).
+_BEFORE = re.compile("^([^A-Za-z0-9]+)[A-Za-z]")
+_AFTER = re.compile("[A-Za-z]([^A-Za-z0-9]+)$")
+
+# Words converted per cmu_to_ipa call while building.
+_BUILD_CHUNK = 5000
+
+
+def _source_path():
+    import eng_to_ipa
+    return os.path.join(os.path.dirname(eng_to_ipa.__file__), "resources", "CMU_dict.db")
+
+
+def _source_stamp(source):
+    # A content hash rather than the mtime: a packaged build unpacks the
+    # dictionary afresh on every launch.
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest().encode("ascii")
+
+
+def build(path=_DEFAULT_PATH):
+    """Writes the lexicon file from eng_to_ipa's CMU dictionary."""
+    import eng_to_ipa
+    source = _source_path()
+    conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    try:
+        pronunciations = {}
+        for word, phonemes in conn.execute("SELECT word, phonemes FROM dictionary"):
+            pronunciations.setdefault(word, []).append(phonemes)
+    finally:
+        conn.close()
+
+    # convert() only ever looks up words with surrounding punctuation
+    # stripped, so entries like "'bout" can never be reached.
+    words = sorted((w for w in pronunciations if w.strip(_PUNCT) == w and w),
+                   key=lambda w: w.encode("utf-8"))
+    values = []
+    for start in range(0, len(words), _BUILD_CHUNK):
+        chunk = words[start:start + _BUILD_CHUNK]
+        ipa = eng_to_ipa.cmu_to_ipa([pronunciations[w] for w in chunk],
+                                    stress_marking="both")
+        # convert() keeps the last of the sorted alternatives (get_top).
+        values.extend(alternatives[-1] for alternatives in ipa)
+
+    key_blob = bytearray()
+    value_blob = bytearray()
+    key_offsets = array("I", [0])
+    value_offsets = array("I", [0])
+    for word, ipa in zip(words, values):
+        key_blob += word.encode("utf-8")
+        value_blob += ipa.encode("utf-8")
+        key_offsets.append(len(key_blob))
+        value_offsets.append(len(value_blob))
+
+    stamp = _source_stamp(source)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(words), len(stamp)))
+        f.write(stamp)
+        f.write(key_offsets.tobytes())
+        f.write(value_offsets.tobytes())
+        f.write(key_blob)
+        f.write(value_blob)
+    # Readers in other processes never see a half-written file.
+    os.replace(tmp_path, path)
+
+
+class _Keys:
+    """The mapped keys as a sorted sequence of bytes, for bisect."""
+
+    def __init__(self, data, offsets, base):
+        self._data = data
+        self._offsets = offsets
+        self._base = base
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return self._data[self._base + self._offsets[i]:self._base + self._offsets[i + 1]]
+
+
+class Lexicon:
+    """Read-only view of a lexicon file. Thread-safe."""
+
+    def __init__(self, path=_DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, stamp_len = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a lexicon file: {path}")
+        pos = _HEADER.size
+        self.stamp = bytes(self._map[pos:pos + stamp_len])
+        pos += stamp_len
+        view = memoryview(self._map)
+        offsets = view[pos:pos + 2 * (count + 1) * 4].cast("I")
+        key_offsets = offsets[:count + 1]
+        value_offsets = offsets[count + 1:]
+        keys_base = pos + len(offsets) * 4
+        self._keys = _Keys(self._map, key_offsets, keys_base)
+        self._value_offsets = value_offsets
+        self._values_base = keys_base + key_offsets[count]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def close(self):
+        self._keys = self._value_offsets = None
+        self._map.close()
+
+    def get(self, word):
+        """IPA for a bare lower-case word, or None if it isn't listed."""
+        key = word.encode("utf-8")
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        start = self._values_base + self._value_offsets[i]
+        end = self._values_base + self._value_offsets[i + 1]
+        return self._map[start:end].decode("utf-8")
+
+
+def _split_token(token):
+    """(before, word, after) the way eng_to_ipa splits a token: word is
+    looked up, before/after are the punctuation it puts back around the
+    result."""
+    lowered = token.lower()
+    before = _BEFORE.search(lowered)
+    after = _AFTER.search(lowered)
+    return (before.group(1) if before else "", lowered.strip(_PUNCT),
+            after.group(1) if after else "")
+
+
+class _MissCache:
+    """Persistent token -> IPA answers for tokens outside the lexicon. Any
+    database error disables it, like the transcript cache."""
+
+    def __init__(self, path=_DEFAULT_MISS_PATH):
+        self.path = path
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS misses (token TEXT PRIMARY KEY, ipa TEXT NOT NULL)")
+        return self._conn
+
+    def get_many(self, tokens):
+        if not self.enabled or not tokens:
+            return {}
+        found = {}
+        with self._lock:
+            try:
+                db = self._db()
+                # Well under SQLite's bound-parameter limit per query.
+                for start in range(0, len(tokens), 500):
+                    chunk = tokens[start:start + 500]
+                    marks = ",".join("?" * len(chunk))
+                    found.update(db.execute(
+                        f"SELECT token, ipa FROM misses WHERE token IN ({marks})", chunk))
+            except (sqlite3.Error, OSError):
+                self.enabled = False
+        return found
+
+    def put_many(self, items):
+        if not self.enabled or not items:
+            return
+        with self._lock:
+            try:
+                db = self._db()
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO misses VALUES (?, ?)", items)
+            except (sqlite3.Error, OSError):
+                self.enabled = False
+
+
+_lexicon = None
+_lexicon_failed = False
+_misses = _MissCache()
+_lock = threading.Lock()
+
+
+def get_lexicon():
+    """The shared Lexicon, building the file on first use (or after an
+    eng_to_ipa upgrade). None if it can't be built or read - lookups then
+    go to eng_to_ipa directly."""
+    global _lexicon, _lexicon_failed
+    if _lexicon is not None or _lexicon_failed:
+        return _lexicon
+    with _lock:
+        if _lexicon is not None or _lexicon_failed:
+            return _lexicon
+        try:
+            stamp = _source_stamp(_source_path())
+            lexicon = None
+            if os.path.exists(_DEFAULT_PATH):
+                try:
+                    lexicon = Lexicon(_DEFAULT_PATH)
+                except (OSError, ValueError, struct.error):
+                    lexicon = None
+            if lexicon is None or lexicon.stamp != stamp:
+                if lexicon is not None:
+                    lexicon.close()  # Windows can't replace a mapped file
+                build(_DEFAULT_PATH)
+                lexicon = Lexicon(_DEFAULT_PATH)
+            _lexicon = lexicon
+        except (ImportError, OSError, ValueError, sqlite3.Error, struct.error):
+            _lexicon_failed = True
+    return _lexicon
+
+
+def ipa_many(tokens):
+    """IPA for each whitespace-free token, exactly as eng_to_ipa.convert()
+    would give it, in order."""
+    lexicon = get_lexicon()
+    results = [None] * len(tokens)
+    missing = {}
+    for i, token in enumerate(tokens):
+        parts = _split_token(token) if lexicon is not None else None
+        ipa = lexicon.get(parts[1]) if parts is not None and parts[1] else None
+        if ipa is None:
+            missing.setdefault(token, []).append(i)
+        else:
+            results[i] = parts[0] + ipa + parts[2]
+    if missing:
+        known = _misses.get_many(list(missing))
+        new = [t for t in missing if t not in known]
+        if new:
+            import eng_to_ipa
+            answers = []
+            for start in range(0, len(new), 500):
+                chunk = new[start:start + 500]
+                # One dictionary query per chunk; every token comes back as
+                # one space-free IPA word.
+                converted = eng_to_ipa.convert(chunk).split(" ")
+                if len(converted) != len(chunk):
+                    converted = [eng_to_ipa.convert(t) for t in chunk]
+                answers.extend(zip(chunk, converted))
+            _misses.put_many(answers)
+            known.update(answers)
+        for token, indexes in missing.items():
+            for i in indexes:
+                results[i] = known[token]
+    return results
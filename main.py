@@ -1,23 +1,38 @@
 """Vak - Audio to Sanskrit converter GUI.
 
 Two workflows:
-  * "Convert Audio Files" tab - drop up to 20 local audio files, get
+  * "Convert Audio Files" tab - drop local audio files, get
     transcription / IPA / Sanskrit / IAST in a table, export to CSV.
     No Google account needed.
   * "Google Drive (Advanced)" tab - the original service-account workflow:
     process a Drive folder and log results to a Google Sheet.
+
+Headless use, for servers and large folders:
+    python main.py batch <dir-or-glob>... --out results.csv [--workers N]
 """
-import csv
+import argparse
+import glob
 import os
-import queue
 import sys
 import threading
-import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext, ttk
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import pipeline
+import result_writer
 from config_manager import ConfigManager
-from processor import DriveBatchProcessor
+from result_store import ResultStore
+
+# Servers without Tk (no python3-tk) can still run "main.py batch".
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, scrolledtext, ttk
+
+    from ui_channel import UiChannel
+    TK_AVAILABLE = True
+except ImportError:
+    TK_AVAILABLE = False
 
 try:
     from tkinterdnd2 import DND_FILES, TkinterDnD
@@ -25,7 +40,19 @@ try:
 except ImportError:
     DND_AVAILABLE = False
 
-MAX_BATCH = 20
+# Results table rows inserted per UI update, and worker messages handled per
+# update, so a large batch streams into the table without freezing the window.
+ROWS_PER_TICK = 200
+MESSAGES_PER_TICK = 500
+# Table cells show at most this many characters; the detail window
+# (double-click) shows the full value.
+CELL_CHARS = 100
+# Files converted at once in the local tab. Each file is almost entirely
+# waiting on the speech API, so a few in flight cuts batch time several-fold.
+# Overridable with "local_workers" in history.json.
+LOCAL_WORKERS = 4
+# Export writes and reports progress this many rows at a time.
+EXPORT_CHUNK_ROWS = 1000
 
 RESULT_COLUMNS = [
     ("file", "File", 150),
@@ -47,9 +74,14 @@ class VakApp:
 
         self.config_manager = ConfigManager()
         self.queued_files = []
-        self.results = []
+        self._queued_set = set()
+        self.results = ResultStore()
+        # Indexes into self.results still waiting for a table row.
+        self._pending_rows = deque()
+        self._failed_before_run = 0
         self.processing = False
-        self.ui_queue = queue.Queue()
+        self.ui_queue = UiChannel(root)
+        self._export_cancel = None
 
         notebook = ttk.Notebook(root)
         notebook.pack(fill="both", expand=True)
@@ -61,7 +93,17 @@ class VakApp:
 
         self._build_local_tab()
         self._build_drive_tab()
-        self._poll_ui_queue()
+        root.bind(UiChannel.EVENT, self._process_ui_updates)
+        # Once the window is up, load the transcription dependencies in the
+        # background so the first conversion doesn't wait for them.
+        root.after_idle(lambda: threading.Thread(
+            target=self._warm_up, daemon=True).start())
+
+    def _warm_up(self):
+        pipeline.warm_up()
+        roster_path = self.config_manager.get_value("roster_path")
+        if roster_path:
+            self._load_roster(roster_path)
 
     # ------------------------------------------------------------------ #
     # Local files tab
@@ -77,7 +119,7 @@ class VakApp:
             tab,
             text=f"\N{HEAVY PLUS SIGN}  {drop_text}\n"
                  f"(or click to browse)\n\n"
-                 f"WAV, MP3, M4A, FLAC, OGG  -  up to {MAX_BATCH} files per batch",
+                 "WAV, MP3, M4A, FLAC, OGG",
             bg="#eef2f7", fg="#2c3e50",
             font=("Segoe UI", 12),
             relief="groove", bd=2,
@@ -103,11 +145,12 @@ class VakApp:
 
         btn_frame = ttk.Frame(queue_frame)
         btn_frame.pack(side="right", fill="y", padx=(8, 0))
-        self.count_label = ttk.Label(btn_frame, text=f"0 / {MAX_BATCH} files")
+        self.count_label = ttk.Label(btn_frame, text="0 files")
         self.count_label.pack(pady=(0, 6))
         ttk.Button(btn_frame, text="Add Files...", command=self.browse_files).pack(fill="x", pady=2)
         ttk.Button(btn_frame, text="Remove Selected", command=self.remove_selected).pack(fill="x", pady=2)
         ttk.Button(btn_frame, text="Clear List", command=self.clear_queue).pack(fill="x", pady=2)
+        ttk.Button(btn_frame, text="Name List...", command=self.choose_roster).pack(fill="x", pady=2)
 
         # Process button + progress
         self.btn_convert = tk.Button(
@@ -155,8 +198,12 @@ class VakApp:
 
         export_frame = ttk.Frame(tab)
         export_frame.pack(fill="x", padx=12, pady=(2, 12))
-        ttk.Button(export_frame, text="Export Results to CSV...",
-                   command=self.export_csv).pack(side="left")
+        self.btn_export = ttk.Button(export_frame, text="Export Results...",
+                                     command=self.export_results)
+        self.btn_export.pack(side="left")
+        self.btn_cancel_export = ttk.Button(export_frame, text="Cancel Export",
+                                            command=self.cancel_export, state="disabled")
+        self.btn_cancel_export.pack(side="left", padx=(8, 0))
         ttk.Button(export_frame, text="Clear Results",
                    command=self.clear_results).pack(side="left", padx=(8, 0))
 
@@ -184,17 +231,12 @@ class VakApp:
             if not os.path.isfile(path) or not pipeline.is_supported(path):
                 skipped.append(os.path.basename(path))
                 continue
-            if path in self.queued_files:
+            if path in self._queued_set:
                 continue
-            if len(self.queued_files) >= MAX_BATCH:
-                messagebox.showwarning(
-                    "Batch limit",
-                    f"Only {MAX_BATCH} files can be processed per batch.\n"
-                    "Extra files were not added.")
-                break
             if pipeline.needs_ffmpeg(path) and not pipeline.ffmpeg_available():
                 needs_ffmpeg.append(os.path.basename(path))
             self.queued_files.append(path)
+            self._queued_set.add(path)
             self.file_listbox.insert(tk.END, os.path.basename(path))
 
         self._update_count()
@@ -214,7 +256,7 @@ class VakApp:
             return
         for index in reversed(self.file_listbox.curselection()):
             self.file_listbox.delete(index)
-            del self.queued_files[index]
+            self._queued_set.discard(self.queued_files.pop(index))
         self._update_count()
 
     def clear_queue(self):
@@ -222,10 +264,42 @@ class VakApp:
             return
         self.file_listbox.delete(0, tk.END)
         self.queued_files.clear()
+        self._queued_set.clear()
         self._update_count()
 
+    def choose_roster(self):
+        """Picks the name list used to correct transcripts whose filename
+        doesn't say what was spoken."""
+        if self.processing:
+            return
+        path = filedialog.askopenfilename(
+            title="Choose a name list (one name or word per line)",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
+        )
+        if not path:
+            current = self.config_manager.get_value("roster_path")
+            if current and messagebox.askyesno(
+                    "Name list", f"Stop using {os.path.basename(current)}?"):
+                self.config_manager.set_value("roster_path", "")
+                pipeline.set_roster(None)
+                self.status_label.config(text="Name list removed")
+            return
+        self.config_manager.set_value("roster_path", path)
+        self.status_label.config(text=f"Loading name list {os.path.basename(path)}...")
+        threading.Thread(target=self._load_roster, args=(path,), daemon=True).start()
+
+    def _load_roster(self, path):
+        try:
+            roster = pipeline.set_roster(path)
+        except (OSError, UnicodeDecodeError) as e:
+            self.ui_queue.put(("status", f"Could not load name list: {e}"))
+            return
+        if roster is not None:
+            self.ui_queue.put(("status", f"Name list: {os.path.basename(path)} "
+                                         f"({len(roster)} entries)"))
+
     def _update_count(self):
-        self.count_label.config(text=f"{len(self.queued_files)} / {MAX_BATCH} files")
+        self.count_label.config(text=f"{len(self.queued_files)} files")
 
     # ---- processing ---- #
     def start_local_processing(self):
@@ -238,15 +312,25 @@ class VakApp:
 
         self._set_processing(True)
         files = list(self.queued_files)
+        self._failed_before_run = self.results.failed
         self.progress.config(maximum=len(files), value=0)
         threading.Thread(target=self._local_worker, args=(files,), daemon=True).start()
 
     def _local_worker(self, files):
-        for i, path in enumerate(files, start=1):
-            self.ui_queue.put(("status", f"Processing {i} of {len(files)}: "
-                                         f"{os.path.basename(path)}"))
-            result = pipeline.process_file(path)
-            self.ui_queue.put(("result", result, i))
+        workers = max(1, self.config_manager.get_int("local_workers", LOCAL_WORKERS))
+        workers = min(workers, len(files))
+        pipeline.size_speech_client(workers)
+        self.ui_queue.put(("status", f"Processing 1 of {len(files)}: "
+                                     f"{os.path.basename(files[0])}"))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # map() yields in submission order, so rows reach the table in
+            # the order the files were queued even if later ones finish first.
+            results = pool.map(pipeline.process_file, files)
+            for i, result in enumerate(results, start=1):
+                self.ui_queue.put(("result", result, i))
+                if i < len(files):
+                    self.ui_queue.put(("status", f"Processing {i + 1} of {len(files)}: "
+                                                 f"{os.path.basename(files[i])}"))
         self.ui_queue.put(("local_done", len(files)))
 
     def _set_processing(self, active):
@@ -257,22 +341,33 @@ class VakApp:
 
     # ---- results ---- #
     def _add_result(self, result):
-        self.results.append(result)
-        if result.ok:
-            status = "OK (name-corrected)" if result.corrected_from else "OK"
-            values = (result.file_name, status, result.text, result.ipa,
-                      result.sanskrit, result.iast, result.iast_separated)
-            tags = ()
-        else:
-            values = (result.file_name, "Failed", result.error, "", "", "", "")
-            tags = ("error",)
-        self.tree.insert("", tk.END, values=values, tags=tags)
+        """Stores the result; its table row is inserted by _insert_rows on a
+        later tick. Only truncated text goes into the table."""
+        self._pending_rows.append((self.results.append(result), result))
+
+    def _insert_rows(self):
+        """Inserts up to ROWS_PER_TICK pending rows into the table."""
+        for _ in range(min(ROWS_PER_TICK, len(self._pending_rows))):
+            index, result = self._pending_rows.popleft()
+            if result.ok:
+                values = (result.file_name, result_writer.status_text(result),
+                          result.text, result.ipa,
+                          result.sanskrit, result.iast, result.iast_separated)
+                tags = ()
+            else:
+                values = (result.file_name, "Failed", result.error, "", "", "", "")
+                tags = ("error",)
+            values = [v if len(v) <= CELL_CHARS else v[:CELL_CHARS - 1] + "\u2026"
+                      for v in values]
+            # The row id is the store index, so the detail view can fetch
+            # the full result without searching the table.
+            self.tree.insert("", tk.END, iid=str(index), values=values, tags=tags)
 
     def show_result_detail(self, event):
         selection = self.tree.selection()
         if not selection:
             return
-        index = self.tree.index(selection[0])
+        index = int(selection[0])
         if index >= len(self.results):
             return
         result = self.results[index]
@@ -285,7 +380,10 @@ class VakApp:
         fields = [("File", result.file_name)]
         if result.ok:
             if result.corrected_from:
-                fields += [("Speech API heard", result.corrected_from)]
+                heard = result.corrected_from
+                if result.correction_source == "roster":
+                    heard += "  (matched in name list)"
+                fields += [("Speech API heard", heard)]
             fields += [("Transcription", result.text), ("IPA", result.ipa),
                        ("Sanskrit", result.sanskrit), ("IAST", result.iast),
                        ("IAST (separated)", result.iast_separated)]
@@ -308,36 +406,74 @@ class VakApp:
         if self.processing:
             return
         self.tree.delete(*self.tree.get_children())
+        self._pending_rows.clear()
         self.results.clear()
 
-    def export_csv(self):
+    def export_results(self):
+        if self._export_cancel is not None:
+            return
         if not self.results:
             messagebox.showinfo("Nothing to export", "Convert some files first.")
             return
         path = filedialog.asksaveasfilename(
-            title="Save results as CSV",
+            title="Save results",
             defaultextension=".csv",
-            filetypes=[("CSV (opens in Excel)", "*.csv")],
+            filetypes=[("CSV (opens in Excel)", "*.csv"),
+                       ("JSON Lines (every field)", "*.jsonl")],
             initialfile="vak_results.csv",
         )
         if not path:
             return
+        # The export reads a snapshot, so it can run while a conversion is
+        # still adding results.
+        self._export_cancel = threading.Event()
+        self.btn_export.config(state="disabled")
+        self.btn_cancel_export.config(state="normal")
+        threading.Thread(target=self._export_worker,
+                         args=(path, self.results.snapshot(), self._export_cancel),
+                         daemon=True).start()
+
+    def cancel_export(self):
+        if self._export_cancel is not None:
+            self._export_cancel.set()
+
+    def _export_worker(self, path, results, cancel):
+        total = len(results)
+        error = None
+        cancelled = False
         try:
-            # utf-8-sig so Excel renders Devanagari and IAST diacritics
-            with open(path, "w", newline="", encoding="utf-8-sig") as f:
-                writer = csv.writer(f)
-                writer.writerow(["File", "Status", "Transcription", "IPA",
-                                 "Sanskrit", "IAST", "IAST (separated)"])
-                for r in self.results:
-                    if r.ok:
-                        writer.writerow([r.file_name, "OK", r.text, r.ipa,
-                                         r.sanskrit, r.iast, r.iast_separated])
-                    else:
-                        writer.writerow([r.file_name, "Failed", r.error,
-                                         "", "", "", ""])
+            with result_writer.ResultWriter(path) as writer:
+                for start in range(0, total, EXPORT_CHUNK_ROWS):
+                    # Only checked between chunks: a cancel that arrives
+                    # after the last one leaves the finished file alone.
+                    if cancel.is_set():
+                        cancelled = True
+                        break
+                    stop = min(start + EXPORT_CHUNK_ROWS, total)
+                    writer.write_many([results[i] for i in range(start, stop)])
+                    self.ui_queue.put(("status", f"Exporting: {stop} of {total} rows"))
+        except Exception as e:  # disk full, a value the encoding can't take, ...
+            error = str(e) or type(e).__name__
+        if cancelled or error:
+            # Don't leave a half-written file that looks like a result.
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.ui_queue.put(("export_done", path, error, cancelled))
+
+    def _export_finished(self, path, error, cancelled):
+        self._export_cancel = None
+        self.btn_export.config(state="normal")
+        self.btn_cancel_export.config(state="disabled")
+        if error:
+            self.status_label.config(text="Export failed")
+            messagebox.showerror("Export failed", error)
+        elif cancelled:
+            self.status_label.config(text="Export cancelled")
+        else:
+            self.status_label.config(text=f"Exported to {os.path.basename(path)}")
             messagebox.showinfo("Exported", f"Results saved to:\n{path}")
-        except OSError as e:
-            messagebox.showerror("Export failed", str(e))
 
     # ------------------------------------------------------------------ #
     # Google Drive tab
@@ -423,6 +559,9 @@ class VakApp:
             args=(sa_path, input_id, done_id, sheet_id), daemon=True).start()
 
     def _drive_worker(self, sa_path, input_id, done_id, sheet_id):
+        # Imported here, not at the top: the Google client libraries take a
+        # noticeable part of startup and most sessions never use this tab.
+        from processor import DriveBatchProcessor
         processor = DriveBatchProcessor(sa_path)
         log = lambda msg: self.ui_queue.put(("drive_log", msg))
 
@@ -439,53 +578,84 @@ class VakApp:
     # ------------------------------------------------------------------ #
     # Thread-safe UI updates
     # ------------------------------------------------------------------ #
-    def _poll_ui_queue(self):
-        try:
-            while True:
-                msg = self.ui_queue.get_nowait()
-                kind = msg[0]
-                if kind == "status":
-                    self.status_label.config(text=msg[1])
-                elif kind == "result":
-                    self._add_result(msg[1])
-                    self.progress.config(value=msg[2])
-                elif kind == "local_done":
-                    failed = sum(1 for r in self.results[-msg[1]:] if not r.ok)
-                    done = msg[1] - failed
-                    self.status_label.config(
-                        text=f"Finished: {done} converted"
-                             + (f", {failed} failed" if failed else ""))
-                    self.clear_queue_after_run()
-                    self._set_processing(False)
-                elif kind == "drive_log":
-                    self.drive_log(msg[1])
-                elif kind == "drive_done":
-                    self.drive_log("Done.")
-                    self._set_processing(False)
-        except queue.Empty:
-            pass
-        self.root.after(100, self._poll_ui_queue)
+    def _process_ui_updates(self, event=None):
+        """Applies worker messages. Runs when the UiChannel wakes the loop,
+        then reschedules itself only while there is a backlog - an idle
+        window does no work at all."""
+        messages, status, log_lines = self.ui_queue.take(MESSAGES_PER_TICK)
+        if status is not None:
+            self.status_label.config(text=status)
+        if log_lines:
+            self.drive_log("\n".join(log_lines))
+        for msg in messages:
+            kind = msg[0]
+            if kind == "result":
+                self._add_result(msg[1])
+                self.progress.config(value=msg[2])
+            elif kind == "local_done":
+                failed = self.results.failed - self._failed_before_run
+                done = msg[1] - failed
+                self.status_label.config(
+                    text=f"Finished: {done} converted"
+                         + (f", {failed} failed" if failed else ""))
+                self.clear_queue_after_run()
+                self._set_processing(False)
+            elif kind == "drive_done":
+                self.drive_log("Done.")
+                self._set_processing(False)
+            elif kind == "export_done":
+                self._export_finished(*msg[1:])
+        self._insert_rows()
+        if self._pending_rows or self.ui_queue.pending():
+            self.root.after(1, self._process_ui_updates)
 
     def clear_queue_after_run(self):
         self.file_listbox.delete(0, tk.END)
         self.queued_files.clear()
+        self._queued_set.clear()
         self._update_count()
 
 
+# Modules main.py should only load on first use (see pipeline.warm_up and
+# _drive_worker); --selftest reports what each costs to import.
+DEFERRED_MODULES = ["numpy", "speech_recognition", "requests", "eng_to_ipa",
+                    "audio_stream", "speech_client", "processor"]
+
+
+def _import_report():
+    """Lines listing the first-import time of each DEFERRED_MODULES entry,
+    or that it was already loaded at startup - which means something
+    imports it eagerly again."""
+    import importlib
+    lines = []
+    for name in DEFERRED_MODULES:
+        if name in sys.modules:
+            lines.append(f"import {name}: loaded at startup")
+            continue
+        started = time.perf_counter()
+        importlib.import_module(name)
+        lines.append(f"import {name}: {(time.perf_counter() - started) * 1000:.0f} ms")
+    return lines
+
+
 def _selftest(out_path):
     """Headless check that the text pipeline works in a packaged build.
     Used by CI on the PyInstaller output; writes results to a file because
     windowed executables have no console."""
-    import eng_to_ipa
+    imports = _import_report()
     import ipa_map
+    import lexicon
     text = "bhakti yoga church judge"
-    ipa = eng_to_ipa.convert(text)
+    # "bhakti" is not in the lexicon, so this covers the eng_to_ipa
+    # fallback as well as the mapped file.
+    ipa = " ".join(lexicon.ipa_many(text.split()))
     sanskrit = ipa_map.ipa_to_sanskrit(ipa.translate(pipeline._IPA_NOISE))
-    iast = ipa_map.sanskrit_to_iast(sanskrit)
-    separated = ipa_map.get_iast_separated(iast)
+    iast, phonemes = ipa_map.transliterate(sanskrit)
+    separated = ",".join(phonemes)
     lines = [f"text: {text}", f"ipa: {ipa}", f"sanskrit: {sanskrit}",
              f"iast: {iast}", f"separated: {separated}",
-             f"dnd: {DND_AVAILABLE}"]
+             f"dnd: {DND_AVAILABLE}",
+             f"lexicon: {len(lexicon.get_lexicon() or ())} words"]
     # Verify the filename-correction module survived packaging and fires on
     # the known failure case ("Kristen Anne by Fitz" heard for a file named
     # "Kristen Ann Beifus"). pipeline degrades gracefully if the module is
@@ -500,16 +670,111 @@ def _selftest(out_path):
     except Exception as e:
         lines.append(f"name_correction error: {e}")
     lines.append(f"name_correction: {correction_ok}")
+    lines += imports
     if all([ipa, sanskrit, iast, separated]) and "*" not in iast and correction_ok:
         lines.append("SELFTEST OK")
     with open(out_path, "w", encoding="utf-8") as f:
         f.write("\n".join(lines) + "\n")
 
 
+def _iter_audio_files(inputs):
+    """Yields supported audio files from directories (searched recursively),
+    file paths and glob patterns, lazily so huge trees start immediately."""
+    for spec in inputs:
+        if os.path.isdir(spec):
+            for dirpath, dirnames, filenames in os.walk(spec):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if pipeline.is_supported(name):
+                        yield os.path.join(dirpath, name)
+        else:
+            for path in sorted(glob.iglob(spec, recursive=True)):
+                if os.path.isfile(path) and pipeline.is_supported(path):
+                    yield path
+
+
+def _process_path(path, use_cache):
+    result = pipeline.process_file(path, use_cache=use_cache)
+    # Large trees often repeat file names across folders; keep the path.
+    result.file_name = path
+    return result
+
+
+def _batch(argv):
+    """Headless batch conversion. Results are streamed to the output file
+    in completion order as files finish, so memory stays flat however many
+    files there are."""
+    parser = argparse.ArgumentParser(
+        prog="main.py batch", description="Convert audio files without the GUI.")
+    parser.add_argument("inputs", nargs="+",
+                        help="directories (searched recursively), files or glob patterns")
+    parser.add_argument("--out", required=True,
+                        help="output file; .jsonl/.json writes JSON lines, anything else CSV")
+    parser.add_argument("--format", choices=result_writer.FORMATS,
+                        help="override the format implied by --out")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="files processed at once (default 8)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always call the speech API, ignoring cached transcripts")
+    parser.add_argument("--roster",
+                        help="name list (one per line) to correct transcripts against "
+                             "when the filename doesn't match")
+    args = parser.parse_args(argv)
+    if args.roster:
+        try:
+            pipeline.set_roster(args.roster)
+        except (OSError, UnicodeDecodeError) as e:
+            parser.error(f"cannot read roster: {e}")
+
+    pipeline.ffmpeg_available()
+    workers = max(1, args.workers)
+    pipeline.size_speech_client(workers)
+    ok = failed = 0
+    started = time.monotonic()
+
+    def report(result):
+        nonlocal ok, failed
+        writer.write(result)
+        if result.ok:
+            ok += 1
+        else:
+            failed += 1
+        done = ok + failed
+        if done % 100 == 0:
+            print(f"{done} files, {done / (time.monotonic() - started):.1f} files/s",
+                  file=sys.stderr)
+
+    with result_writer.ResultWriter(args.out, args.format) as writer, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for path in _iter_audio_files(args.inputs):
+            # Keep the submission queue short: a lazily walked tree of tens
+            # of thousands of files never turns into tens of thousands of
+            # queued futures.
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report(future.result())
+            pending.add(pool.submit(_process_path, path, not args.no_cache))
+        for future in wait(pending).done:
+            report(future.result())
+
+    elapsed = time.monotonic() - started
+    total = ok + failed
+    print(f"Processed {total} files ({ok} converted, {failed} failed) in {elapsed:.1f} s"
+          f" - {total / elapsed if elapsed else 0:.2f} files/s. Results: {args.out}")
+    return 0 if total else 1
+
+
 def main():
     if len(sys.argv) >= 2 and sys.argv[1] == "--selftest":
         _selftest(sys.argv[2] if len(sys.argv) > 2 else "selftest_out.txt")
         return
+    if len(sys.argv) >= 2 and sys.argv[1] == "batch":
+        sys.exit(_batch(sys.argv[2:]))
+    if not TK_AVAILABLE:
+        sys.exit("The GUI needs Tk (tkinter), which this Python doesn't have. "
+                 "Install it, or use 'main.py batch'.")
     root = TkinterDnD.Tk() if DND_AVAILABLE else tk.Tk()
     VakApp(root)
     root.mainloop()
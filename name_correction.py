@@ -15,8 +15,9 @@ the wrong words for them).
 """
 import os
 import re
+from functools import lru_cache
 
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 import jellyfish
 
 # Similarity (0-100) required before the filename replaces the transcript.
@@ -29,6 +30,14 @@ DEFAULT_THRESHOLD = 70
 _COPY_SUFFIX = re.compile(r"(\s*[\(\[]\d+[\)\]]|\s*-\s*copy(\s*\d*)?)+$", re.IGNORECASE)
 _SEPARATORS = re.compile(r"[_\-\.]+")
 _MULTISPACE = re.compile(r"\s+")
+_WORD = re.compile(r"[A-Za-z']+")
+_NOT_LETTER = re.compile(r"[^A-Za-z]")
+
+# Distinct strings whose Metaphone encoding (and paths whose cleaned stem)
+# is remembered. Stems and transcripts repeat a lot across a batch, and a
+# backfill re-scores the same ones at every threshold, so most are
+# computed once.
+PHONETIC_CACHE_SIZE = 65536
 
 
 def clean_stem(path):
@@ -40,10 +49,18 @@ def clean_stem(path):
     return _MULTISPACE.sub(" ", stem).strip()
 
 
+@lru_cache(maxsize=PHONETIC_CACHE_SIZE)
+def _usable_stem(path):
+    """clean_stem(path), or None if it has fewer than two letters."""
+    stem = clean_stem(path)
+    return stem if len(_NOT_LETTER.sub("", stem)) >= 2 else None
+
+
+@lru_cache(maxsize=PHONETIC_CACHE_SIZE)
 def _phonetic(text):
     """Word-by-word Metaphone encoding, joined with spaces."""
     encoded = []
-    for word in re.findall(r"[A-Za-z']+", text):
+    for word in _WORD.findall(text):
         try:
             encoded.append(jellyfish.metaphone(word))
         except Exception:
@@ -72,13 +89,225 @@ def correct_transcript(transcript, path, threshold=DEFAULT_THRESHOLD):
     transcript is returned as corrected_from so the UI can show what
     happened. Otherwise the transcript passes through untouched.
     """
-    stem = clean_stem(path)
-
     # A usable stem needs at least two letters; "01.wav" tells us nothing.
-    if len(re.sub(r"[^A-Za-z]", "", stem)) < 2 or not transcript.strip():
+    stem = _usable_stem(path)
+    if stem is None or not transcript.strip():
         return transcript, None, 0
 
     score = similarity(transcript, stem)
+    return _decide(transcript, stem, score, threshold)
+
+
+def _decide(transcript, stem, score, threshold):
     if score >= threshold and transcript.strip().lower() != stem.lower():
         return stem, transcript, score
     return transcript, None, score
+
+
+def correct_transcripts(pairs, threshold=DEFAULT_THRESHOLD):
+    """correct_transcript() over many (transcript, path) pairs at once,
+    returning the same (final_text, corrected_from_or_None, score) tuples in
+    order. Each scorer runs over the whole batch in one rapidfuzz call
+    spread across all cores, so re-scoring tens of thousands of stored
+    transcripts (e.g. to tune DEFAULT_THRESHOLD) takes seconds."""
+    pairs = list(pairs)
+    results = [None] * len(pairs)
+    todo, stems = [], []
+    for i, (transcript, path) in enumerate(pairs):
+        stem = _usable_stem(path)
+        if stem is None or not transcript.strip():
+            results[i] = (transcript, None, 0)
+        else:
+            todo.append(i)
+            stems.append(stem)
+    if not todo:
+        return results
+
+    cpdist = getattr(process, "cpdist", None)
+    if cpdist is None:
+        # rapidfuzz before 3.6 has no pairwise batch scorer.
+        for i, stem in zip(todo, stems):
+            transcript = pairs[i][0]
+            results[i] = _decide(transcript, stem, similarity(transcript, stem), threshold)
+        return results
+
+    import numpy as np
+    texts = [pairs[i][0].lower().strip() for i in todo]
+    lowered_stems = [stem.lower().strip() for stem in stems]
+    # float64 so scores are exactly the ones similarity() returns.
+    scores = np.maximum.reduce([
+        cpdist(texts, lowered_stems, scorer=fuzz.ratio, dtype=np.float64, workers=-1),
+        cpdist(texts, lowered_stems, scorer=fuzz.token_sort_ratio,
+               dtype=np.float64, workers=-1),
+        cpdist([_phonetic(pairs[i][0]) for i in todo], [_phonetic(s) for s in stems],
+               scorer=fuzz.ratio, dtype=np.float64, workers=-1),
+    ])
+    for i, stem, score in zip(todo, stems, scores.tolist()):
+        results[i] = _decide(pairs[i][0], stem, score, threshold)
+    return results
+
+
+# ---------------------------------------------------------------------- #
+# Roster matching
+# ---------------------------------------------------------------------- #
+# When the filename says nothing ("New Recording 12.m4a"), the transcript
+# can still be matched against a roster - a plain text file with one name
+# or word per line. Scoring every entry of a large roster per file is too
+# slow, so RosterIndex buckets the entries by their Metaphone encoding and
+# by character trigrams of both the encoding and the spelling; a query only
+# scores the entries sharing the most trigrams with it.
+
+# Entries scored per query, taken from the best trigram overlaps.
+ROSTER_CANDIDATES = 200
+
+
+def _trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _index_keys(lower, phonetic):
+    """Bucket keys for one entry or query. Spelling and phonetic trigrams
+    are kept apart with a prefix."""
+    keys = {"t" + g for g in _trigrams(lower)}
+    keys.update("p" + g for g in _trigrams(phonetic.replace(" ", "")))
+    return keys
+
+
+class RosterIndex:
+    """Searchable roster. Build with RosterIndex.load(path), which reuses
+    the index saved next to the roster (path + INDEX_SUFFIX) unless the
+    roster has changed since.
+
+    The saved index is an uncompressed .npz holding only plain arrays - a
+    UTF-8 JSON header (stamp, entries, their encodings, posting keys) and
+    the postings back to back - and is read with allow_pickle=False, so a
+    file planted next to a shared roster can't run code when loaded."""
+
+    INDEX_SUFFIX = ".vakidx"
+    _VERSION = 2
+
+    def __init__(self, entries, phonetic=None, postings=None):
+        """phonetic and postings are passed in when loading a saved index;
+        otherwise they are computed from entries."""
+        import numpy as np
+        self.entries = entries
+        self.lower = [e.lower().strip() for e in entries]
+        self.phonetic = phonetic if phonetic is not None else [_phonetic(e) for e in entries]
+        # Exact Metaphone encoding -> entries; these are always scored.
+        self.by_code = {}
+        for i, code in enumerate(self.phonetic):
+            self.by_code.setdefault(code, []).append(i)
+        if postings is None:
+            grouped = {}
+            for i, (lower, code) in enumerate(zip(self.lower, self.phonetic)):
+                for key in _index_keys(lower, code):
+                    grouped.setdefault(key, []).append(i)
+            postings = {key: np.array(ids, dtype=np.int32) for key, ids in grouped.items()}
+        self.postings = postings
+
+    @staticmethod
+    def read_entries(path):
+        """Non-empty, de-duplicated lines of a UTF-8 roster file."""
+        with open(path, encoding="utf-8-sig") as f:
+            lines = (_MULTISPACE.sub(" ", line).strip() for line in f)
+            return list(dict.fromkeys(line for line in lines if line))
+
+    @classmethod
+    def load(cls, path):
+        st = os.stat(path)
+        stamp = [cls._VERSION, st.st_size, st.st_mtime_ns]
+        index_path = path + cls.INDEX_SUFFIX
+        index = cls._read(index_path, stamp)
+        if index is not None:
+            return index
+        index = cls(cls.read_entries(path))
+        try:
+            index._write(index_path, stamp)
+        except OSError:
+            pass  # a read-only folder just means rebuilding next time
+        return index
+
+    @classmethod
+    def _read(cls, index_path, stamp):
+        """The index saved at index_path, or None if it is missing, stale
+        or unreadable (including indexes saved by older versions)."""
+        import json
+        import zipfile
+        import numpy as np
+        try:
+            with np.load(index_path, allow_pickle=False) as data:
+                header = json.loads(data["header"].tobytes().decode("utf-8"))
+                if header["stamp"] != stamp:
+                    return None
+                ids, offsets = data["ids"], data["offsets"]
+            keys = header["keys"]
+            postings = {key: ids[offsets[i]:offsets[i + 1]] for i, key in enumerate(keys)}
+            return cls(header["entries"], header["phonetic"], postings)
+        except (OSError, ValueError, KeyError, TypeError, IndexError, zipfile.BadZipFile):
+            return None
+
+    def _write(self, index_path, stamp):
+        import json
+        import numpy as np
+        keys = list(self.postings)
+        lengths = [len(self.postings[key]) for key in keys]
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ids = (np.concatenate([self.postings[key] for key in keys]) if keys
+               else np.zeros(0, dtype=np.int32))
+        header = json.dumps({"stamp": stamp, "entries": self.entries,
+                             "phonetic": self.phonetic, "keys": keys},
+                            ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, header=np.frombuffer(header, dtype=np.uint8), ids=ids, offsets=offsets)
+        os.replace(tmp_path, index_path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _candidates(self, lower, code):
+        """Indexes of the entries worth scoring against a transcript, given
+        its lower-cased text and phonetic encoding."""
+        import numpy as np
+        hits = [self.postings[key] for key in _index_keys(lower, code)
+                if key in self.postings]
+        ids = set(self.by_code.get(code, ()))
+        if hits:
+            found, counts = np.unique(np.concatenate(hits), return_counts=True)
+            if len(found) > ROSTER_CANDIDATES:
+                found = found[np.argpartition(counts, -ROSTER_CANDIDATES)[-ROSTER_CANDIDATES:]]
+            ids.update(found.tolist())
+        return list(ids)
+
+    def best_match(self, transcript, score_cutoff=0):
+        """(entry, score) of the roster entry most similar to transcript
+        under the same measure as similarity(), or (None, 0)."""
+        lower, code = transcript.lower().strip(), _phonetic(transcript)
+        ids = self._candidates(lower, code)
+        if not ids:
+            return None, 0
+        texts = [self.lower[i] for i in ids]
+        best_id, best_score = None, 0
+        for query, choices, scorer in ((lower, texts, fuzz.ratio),
+                                       (lower, texts, fuzz.token_sort_ratio),
+                                       (code, [self.phonetic[i] for i in ids], fuzz.ratio)):
+            found = process.extractOne(query, choices, scorer=scorer,
+                                       score_cutoff=max(score_cutoff, best_score))
+            if found is not None and (best_id is None or found[1] > best_score):
+                best_id, best_score = ids[found[2]], found[1]
+        if best_id is None:
+            return None, 0
+        return self.entries[best_id], best_score
+
+    def correct(self, transcript, threshold=DEFAULT_THRESHOLD):
+        """Like correct_transcript, with the best roster entry standing in
+        for the filename stem."""
+        if not transcript.strip():
+            return transcript, None, 0
+        entry, score = self.best_match(transcript, threshold)
+        if entry is not None and score >= threshold \
+                and transcript.strip().lower() != entry.lower():
+            return entry, transcript, score
+        return transcript, None, score
@@ -3,16 +3,22 @@
 Processes a single local audio file with no Google account required.
 Both the local GUI tab and the Google Drive batch processor run files
 through process_file().
+
+The heavy dependencies - numpy and speech_recognition (via audio_stream and
+speech_client), requests, eng_to_ipa - are imported on first use rather
+than with this module, so the GUI can open without paying for them;
+warm_up() loads them ahead of time on a background thread.
 """
 import os
 import shutil
-import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-
-import eng_to_ipa
-import speech_recognition as sr
+from functools import lru_cache
 
 import ipa_map
+import lexicon
+import transcript_cache
 
 # Filename-based transcript correction (see name_correction.py). Optional:
 # if rapidfuzz/jellyfish aren't installed the pipeline still runs, it just
@@ -22,9 +28,10 @@ try:
 except ImportError:
     name_correction = None
 
-# Formats the speech_recognition library reads natively.
+# Formats the speech_recognition library reads natively. Same set as
+# audio_stream.NATIVE_FORMATS, spelled out so format checks don't import it.
 NATIVE_FORMATS = {'.wav', '.aiff', '.aif', '.flac'}
-# Formats that must first be converted to WAV via pydub, which needs ffmpeg.
+# Formats that must be decoded by ffmpeg.
 CONVERTIBLE_FORMATS = {'.mp3', '.m4a', '.ogg', '.aac', '.wma'}
 SUPPORTED_FORMATS = NATIVE_FORMATS | CONVERTIBLE_FORMATS
 
@@ -34,6 +41,26 @@ SUPPORTED_FORMATS = NATIVE_FORMATS | CONVERTIBLE_FORMATS
 _IPA_NOISE = str.maketrans('', '', 'ˈˌ*')
 
 
+# Chunks of one long recording sent to the speech API at once. This also
+# bounds memory: only this many chunks are decoded ahead of the API.
+CHUNK_WORKERS = 4
+
+# Trim dead air and resample to audio_stream.TARGET_SAMPLE_RATE before each
+# speech request (see audio_stream.preprocess). Cuts upload size several-fold
+# for typical 48 kHz clips; switch off to send audio exactly as decoded.
+PREPROCESS_AUDIO = True
+
+# Skip files that pre-screening finds empty, truncated, too short or silent
+# (see audio_stream.screen_header / is_silent) without calling the speech API.
+PRESCREEN_AUDIO = True
+
+# Distinct words remembered by the text-stage cache (keyed by their IPA,
+# which comes from the memory-mapped lexicon - see lexicon.py). Transcripts
+# reuse the same vocabulary across files, so after the first few files most
+# words skip the Sanskrit/IAST mapping entirely.
+WORD_CACHE_SIZE = 50000
+
+
 @dataclass
 class PipelineResult:
     file_name: str
@@ -44,9 +71,21 @@ class PipelineResult:
     iast: str = ""
     iast_separated: str = ""
     error: str = ""
-    # When the transcript was replaced by the filename stem, this holds what
-    # the speech API originally heard (empty string = no correction applied).
+    # When the transcript was replaced by the filename stem or a roster
+    # entry, this holds what the speech API originally heard (empty string =
+    # no correction applied), and correction_source says which one matched:
+    # "filename" or "roster".
     corrected_from: str = ""
+    correction_source: str = ""
+    # True when the transcript came from the transcript cache, not the API.
+    cached: bool = False
+    # PCM bytes decoded from the file vs. bytes sent to the speech API after
+    # preprocessing (both 0 for cached results).
+    audio_bytes_before: int = 0
+    audio_bytes_after: int = 0
+    # Why pre-screening failed the file without calling the speech API
+    # ("empty", "too_short", "truncated" or "silent"; empty = not skipped).
+    skip_reason: str = ""
 
     def as_row(self):
         """Values in Google Sheet / CSV column order (without timestamp)."""
@@ -83,7 +122,7 @@ def _bundled_ffmpeg():
 
 
 # Cached path to whichever ffmpeg ffmpeg_available() decided to use, so
-# _to_wav() can point pydub at it without re-searching.
+# the decoder can run it without re-searching.
 _ffmpeg_path = None
 
 
@@ -105,60 +144,163 @@ def ffmpeg_available():
     return False
 
 
-_pydub_mediainfo_patched = False
+def needs_ffmpeg(path):
+    return os.path.splitext(path)[1].lower() in CONVERTIBLE_FORMATS
+
 
+def is_supported(path):
+    return os.path.splitext(path)[1].lower() in SUPPORTED_FORMATS
 
-def _patch_pydub_mediainfo():
-    """pydub's AudioSegment.from_file() shells out to ffprobe (via
-    mediainfo_json) purely to refine the output bit depth. imageio-ffmpeg
-    bundles ffmpeg but not ffprobe, so on a machine with no system ffprobe
-    that call raises FileNotFoundError and aborts the whole conversion.
-    Make the probe best-effort: if it's missing, fall back to ffmpeg's
-    default 16-bit PCM WAV output, which is what speech_recognition
-    expects anyway."""
-    global _pydub_mediainfo_patched
-    if _pydub_mediainfo_patched:
-        return
-    import pydub.audio_segment as _seg
-    original = _seg.mediainfo_json
 
-    def safe_mediainfo_json(filepath, read_ahead_limit=-1):
-        try:
-            return original(filepath, read_ahead_limit=read_ahead_limit)
-        except Exception:
-            return None
+# Speech client shared by every file and thread, created on first use so
+# its connections stay warm across a whole batch.
+_speech_client = None
 
-    _seg.mediainfo_json = safe_mediainfo_json
-    _pydub_mediainfo_patched = True
 
+def get_speech_client():
+    global _speech_client
+    if _speech_client is None:
+        import speech_client
+        _speech_client = speech_client.SpeechClient()
+    return _speech_client
 
-def needs_ffmpeg(path):
-    return os.path.splitext(path)[1].lower() in CONVERTIBLE_FORMATS
 
+def set_speech_client(client):
+    """Replaces the shared client, e.g. with one pointed at a stand-in
+    endpoint or with different timeout/retry settings."""
+    global _speech_client
+    _speech_client = client
 
-def is_supported(path):
-    return os.path.splitext(path)[1].lower() in SUPPORTED_FORMATS
 
+def size_speech_client(files_at_once):
+    """Makes sure the shared client keeps a connection alive for every
+    request that files_at_once files in flight can have open (up to
+    CHUNK_WORKERS each), replacing it with a larger one if needed. Call at
+    the start of a run; a smaller pool makes urllib3 throw the extra
+    connections away after every request."""
+    global _speech_client
+    needed = max(1, files_at_once) * CHUNK_WORKERS
+    client = get_speech_client()
+    if getattr(client, "pool_size", needed) < needed:
+        _speech_client = client.with_pool_size(needed)
 
-def _to_wav(path):
-    """Returns (readable_path, temp_path_or_None). Converts via pydub when
-    the format is not natively readable."""
-    if os.path.splitext(path)[1].lower() in NATIVE_FORMATS:
-        return path, None
 
-    from pydub import AudioSegment  # deferred: pulls in ffmpeg machinery
-    _patch_pydub_mediainfo()
-    if _ffmpeg_path:
-        AudioSegment.converter = _ffmpeg_path
-    fd, wav_path = tempfile.mkstemp(suffix=".wav")
-    os.close(fd)
-    audio = AudioSegment.from_file(path)
-    audio.export(wav_path, format="wav")
-    return wav_path, wav_path
+def _recognize_chunk(client, audio_data):
+    """One chunk's transcript; a chunk with no speech in it is just empty,
+    the recording as a whole may still have some."""
+    import speech_recognition as sr
+    try:
+        return client.recognize(audio_data)
+    except sr.UnknownValueError:
+        return ""
+
+
+class _Skipped(Exception):
+    """Pre-screening found nothing worth sending to the speech API."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _cache_settings():
+    """Everything besides the audio bytes that affects the transcript."""
+    settings = get_speech_client().cache_tag()
+    if not PREPROCESS_AUDIO:
+        return settings
+    import audio_stream
+    return (f"{settings}|{audio_stream.TARGET_SAMPLE_RATE}Hz"
+            f"|trim{audio_stream.TRIM_THRESHOLD_DB}dB")
+
+
+def _prepared_chunks(stream, result):
+    """Yields the stream's chunks ready to send, tallying bytes before and
+    after preprocessing on result. Silent chunks, and chunks trimmed down
+    to nothing, are dropped - there is nothing in them to transcribe."""
+    import audio_stream
+    for chunk in audio_stream.iter_chunks(stream):
+        result.audio_bytes_before += len(chunk.frame_data)
+        if PRESCREEN_AUDIO and audio_stream.is_silent(chunk):
+            continue
+        if PREPROCESS_AUDIO:
+            chunk = audio_stream.preprocess(chunk)
+            if not chunk.frame_data:
+                continue
+        result.audio_bytes_after += len(chunk.frame_data)
+        yield chunk
+
+
+def _transcribe(path, client, result):
+    """Streams the file in silence-split chunks, sends them to the speech
+    API in parallel and joins the transcripts in order. Raises _Skipped if
+    no chunk was worth sending, sr.UnknownValueError if none had
+    intelligible speech."""
+    import audio_stream
+    import speech_recognition as sr
+    ffmpeg_exe = (_ffmpeg_path or 'ffmpeg') if ffmpeg_available() else None
+    with audio_stream.open_stream(path, ffmpeg_exe) as stream:
+        chunks = _prepared_chunks(stream, result)
+        first = next(chunks, None)
+        if first is None:
+            if not result.audio_bytes_before:
+                raise _Skipped("empty", "File contains no audio")
+            raise _Skipped("silent", "Recording is silent")
+        second = next(chunks, None)
+        if second is None:
+            # The common case - a short clip - needs no thread pool.
+            return client.recognize(first)
+
+        texts = []
+        with ThreadPoolExecutor(max_workers=CHUNK_WORKERS) as pool:
+            in_flight = deque()
+            for chunk in (first, second):
+                in_flight.append(pool.submit(_recognize_chunk, client, chunk))
+            for chunk in chunks:
+                # Wait for the oldest chunk before decoding further ahead.
+                if len(in_flight) >= CHUNK_WORKERS:
+                    texts.append(in_flight.popleft().result())
+                in_flight.append(pool.submit(_recognize_chunk, client, chunk))
+            texts.extend(future.result() for future in in_flight)
+
+    text = " ".join(t for t in texts if t)
+    if not text:
+        raise sr.UnknownValueError()
+    return text
+
+
+# Roster of known names/words for name correction, see set_roster().
+_roster = None
+
+
+def set_roster(path):
+    """Loads the roster file at path (one name or word per line) for name
+    correction, reusing its saved index when the file is unchanged; None
+    or "" stops using a roster. Raises OSError if the file can't be read."""
+    global _roster
+    if not path or name_correction is None:
+        _roster = None
+        return None
+    _roster = name_correction.RosterIndex.load(path)
+    return _roster
+
+
+# Shared transcript cache, opened on first use. Set VAK_NO_TRANSCRIPT_CACHE=1
+# (or pass use_cache=False to process_file) to always call the speech API.
+_transcript_cache = None
+
 
+def get_transcript_cache():
+    global _transcript_cache
+    if _transcript_cache is None:
+        _transcript_cache = transcript_cache.TranscriptCache(
+            enabled=not os.environ.get('VAK_NO_TRANSCRIPT_CACHE'))
+    return _transcript_cache
 
-def process_file(path):
-    """Transcribes one audio file and derives IPA, Sanskrit and IAST."""
+
+def process_file(path, use_cache=True):
+    """Transcribes one audio file and derives IPA, Sanskrit and IAST.
+    Audio already transcribed in an earlier run is answered from the
+    transcript cache unless use_cache is False."""
     result = PipelineResult(file_name=os.path.basename(path))
 
     if not os.path.exists(path):
@@ -171,14 +313,26 @@ def process_file(path):
         result.error = "FFmpeg is required to convert this format - install it or use WAV/FLAC"
         return result
 
-    temp_wav = None
+    import audio_stream
+    import speech_recognition as sr
     try:
-        wav_path, temp_wav = _to_wav(path)
-
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(wav_path) as source:
-            audio_data = recognizer.record(source)
-        result.text = recognizer.recognize_google(audio_data)
+        if PRESCREEN_AUDIO:
+            problem = audio_stream.screen_header(path)
+            if problem:
+                raise _Skipped(*problem)
+
+        cache = get_transcript_cache() if use_cache else None
+        cache_key = None
+        if cache is not None and cache.enabled:
+            cache_key = transcript_cache.content_key(path, _cache_settings())
+            cached_text = cache.get(cache_key)
+            if cached_text is not None:
+                result.text, result.cached = cached_text, True
+
+        if not result.cached:
+            result.text = _transcribe(path, get_speech_client(), result)
+            if cache_key is not None:
+                cache.put(cache_key, result.text)
 
         # The free Web Speech API can't be given vocabulary hints, so names
         # it doesn't know become soundalike common words. The filename is
@@ -187,9 +341,20 @@ def process_file(path):
         if name_correction is not None:
             corrected, was, _score = name_correction.correct_transcript(
                 result.text, path)
+            source = "filename"
+            # Filenames like "New Recording 12.m4a" say nothing; the roster
+            # may still know the name.
+            if was is None and _roster is not None:
+                corrected, was, _score = _roster.correct(result.text)
+                source = "roster"
             if was is not None:
                 result.text = corrected
                 result.corrected_from = was
+                result.correction_source = source
+    except _Skipped as e:
+        result.skip_reason = e.reason
+        result.error = f"{e} - not sent for transcription"
+        return result
     except sr.UnknownValueError:
         result.error = "No intelligible speech detected"
         return result
@@ -199,21 +364,83 @@ def process_file(path):
     except Exception as e:
         result.error = f"Could not read audio: {e}"
         return result
-    finally:
-        if temp_wav and os.path.exists(temp_wav):
-            try:
-                os.remove(temp_wav)
-            except OSError:
-                pass
 
+    _convert_text(result)
+    return result
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def _convert_ipa(ipa):
+    """One word's IPA -> (sanskrit, iast, phonemes).
+
+    Every stage after eng_to_ipa treats a space as a plain separator that no
+    mapping rule crosses, so converting word by word and joining gives the
+    same output as converting the whole transcript at once."""
+    sanskrit = ipa_map.ipa_to_sanskrit(ipa.translate(_IPA_NOISE))
+    iast, phonemes = ipa_map.transliterate(sanskrit)
+    return sanskrit, iast, tuple(phonemes)
+
+
+def _convert_text(result, ipas=None):
+    """Fills the IPA / Sanskrit / IAST fields of result from result.text.
+    ipas, if given, is the lexicon's answer for result.text.split()."""
     try:
-        result.ipa = eng_to_ipa.convert(result.text)
-        clean_ipa = result.ipa.translate(_IPA_NOISE)
-        result.sanskrit = ipa_map.ipa_to_sanskrit(clean_ipa)
-        result.iast = ipa_map.sanskrit_to_iast(result.sanskrit)
-        result.iast_separated = ipa_map.get_iast_separated(result.iast)
+        if ipas is None:
+            ipas = lexicon.ipa_many(result.text.split())
+        words = [_convert_ipa(ipa) for ipa in ipas]
+        result.ipa = " ".join(ipas)
+        result.sanskrit = " ".join(w[0] for w in words)
+        result.iast = " ".join(w[1] for w in words)
+        separated = []
+        for w in words:
+            if separated:
+                separated.append(" ")
+            separated.extend(w[2])
+        result.iast_separated = ",".join(separated)
         result.ok = True
     except Exception as e:
         result.error = f"Phonetic conversion failed: {e}"
 
-    return result
+
+def convert_texts(texts):
+    """Runs the text half of the pipeline (IPA -> Sanskrit -> IAST ->
+    separated IAST) over already-transcribed texts, returning one
+    PipelineResult per input in order. All words go to the lexicon in one
+    batch, and the later stages share an LRU cache, so re-running stored
+    transcripts is mostly lookups."""
+    texts = list(texts)  # read twice below; may be a generator
+    tokens = [text.split() for text in texts]
+    try:
+        ipas = lexicon.ipa_many([t for words in tokens for t in words])
+    except Exception:
+        # Convert text by text instead, so only the texts that fail get
+        # "Phonetic conversion failed".
+        ipas = None
+    results = []
+    pos = 0
+    for text, words in zip(texts, tokens):
+        result = PipelineResult(file_name="", text=text)
+        _convert_text(result, ipas[pos:pos + len(words)] if ipas is not None else None)
+        pos += len(words)
+        results.append(result)
+    return results
+
+
+def word_cache_info():
+    """Hit/miss/size counters of the text-stage word cache."""
+    return _convert_ipa.cache_info()
+
+
+def clear_word_cache():
+    _convert_ipa.cache_clear()
+
+
+def warm_up():
+    """Imports the transcription dependencies, opens (on the very first
+    run, builds) the pronunciation lexicon and resolves ffmpeg, so the first
+    file doesn't pay for them. Meant for a background thread at startup;
+    safe to call more than once."""
+    import audio_stream  # numpy, speech_recognition
+    get_speech_client()  # requests, plus the shared session
+    lexicon.get_lexicon()
+    ffmpeg_available()
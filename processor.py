@@ -3,11 +3,18 @@
 Downloads audio files from a Drive folder, runs each through the local
 pipeline (pipeline.process_file), logs results to a Google Sheet and moves
 processed files to a "Done" folder.
+
+The four steps run as stages connected by bounded queues, each with its own
+thread count, so Drive, speech and Sheets latencies overlap instead of
+adding up. A full queue blocks the stage feeding it, which caps how many
+downloaded files sit in the temp folder at once.
 """
-import io
+import csv
 import os
+import queue
 import re
 import tempfile
+import threading
 import time
 
 import gspread
@@ -15,19 +22,142 @@ from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 
+import app_paths
 import pipeline
 
 
+# Tells a stage worker that no more items are coming.
+_DONE = object()
+
+
+def _rate(num_bytes, seconds):
+    """'12.3 MB in 4.1 s (3.0 MB/s)' for the log."""
+    mb = num_bytes / (1024 * 1024)
+    return f"{mb:.1f} MB in {seconds:.1f} s ({mb / max(seconds, 1e-6):.1f} MB/s)"
+
+
+def _remove_download(local_path):
+    """Deletes a downloaded file and the folder download_file made for it."""
+    for remove, path in ((os.remove, local_path), (os.rmdir, os.path.dirname(local_path))):
+        try:
+            remove(path)
+        except OSError:
+            pass
+
+
+class SheetRowBuffer:
+    """Collects result rows and appends them to the first worksheet of a
+    Google Sheet in batches.
+
+    The worksheet handle is opened once and reused, and rows go out with a
+    single append_rows call every max_rows rows or max_seconds seconds,
+    instead of an open_by_key + append_row pair per file. Rows that fail to
+    write stay in `pending` and are retried by a later flush. After a
+    failure the buffer isn't due again for max_seconds, doubling with each
+    further failure up to MAX_BACKOFF - otherwise every new row would
+    resend the whole backlog to an API that is already refusing it.
+    """
+
+    MAX_BACKOFF = 300.0
+
+    def __init__(self, sheets_client, sheet_id, max_rows=50, max_seconds=10.0):
+        self.sheets_client = sheets_client
+        self.sheet_id = sheet_id
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.pending = []
+        self._worksheet = None
+        self._last_flush = time.monotonic()
+        self._failures = 0      # consecutive failed flushes
+        self._retry_at = None   # monotonic time before which not to retry
+
+    def add(self, row):
+        self.pending.append(row)
+
+    def due(self):
+        if not self.pending:
+            return False
+        now = time.monotonic()
+        if self._retry_at is not None and now < self._retry_at:
+            return False
+        return (len(self.pending) >= self.max_rows
+                or now - self._last_flush >= self.max_seconds)
+
+    def flush(self):
+        """Writes all pending rows. Returns (ok, row_count, error)."""
+        self._last_flush = time.monotonic()
+        rows = list(self.pending)
+        if not rows:
+            return True, 0, None
+        try:
+            if self._worksheet is None:
+                self._worksheet = self.sheets_client.open_by_key(self.sheet_id).sheet1
+            self._worksheet.append_rows(rows)
+        except Exception as e:
+            # The cached handle may be what went stale; reopen next time.
+            self._worksheet = None
+            self._failures += 1
+            self._retry_at = self._last_flush + min(
+                self.max_seconds * 2 ** (self._failures - 1), self.MAX_BACKOFF)
+            return False, len(rows), str(e)
+        del self.pending[:len(rows)]
+        self._failures = 0
+        self._retry_at = None
+        return True, len(rows), None
+
+
 class DriveBatchProcessor:
     SCOPES = [
         'https://www.googleapis.com/auth/drive',
         'https://www.googleapis.com/auth/spreadsheets',
     ]
 
+    # Threads for the download and transcribe stages. The sheet and move
+    # stages always run on a single thread each: they batch their work, and
+    # their buffers (rows.pending / held, moves) are unlocked and rely on
+    # staying in step with each other.
+    DOWNLOAD_WORKERS = 2
+    TRANSCRIBE_WORKERS = 4
+    # Items allowed to wait between two stages.
+    QUEUE_SIZE = 8
+    # Sheet rows are appended in batches of this many rows, or after this
+    # many seconds, whichever comes first.
+    SHEET_BATCH_ROWS = 50
+    SHEET_FLUSH_SECONDS = 10.0
+    # Moves are sent as Drive batch requests of up to this many files (the
+    # API's limit is 100), at least every MOVE_FLUSH_SECONDS.
+    MOVE_BATCH_SIZE = 100
+    MOVE_FLUSH_SECONDS = 5.0
+    # Sheet columns, also used for the CSV of rows the sheet didn't take.
+    SHEET_COLUMNS = ["Filename", "Timestamp", "Text", "Phonetic", "Sanskrit", "IAST",
+                     "IAST_Separated"]
+    # Folder listing page size (the API maximum).
+    LIST_PAGE_SIZE = 1000
+    # Attempts at the final sheet flush before giving up on the leftovers.
+    SHEET_FLUSH_RETRIES = 3
+    # Bytes requested per Drive download round trip. Each chunk is written
+    # straight to disk, so this (not the file size) bounds memory per
+    # download.
+    DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
     def __init__(self, service_account_path):
         self.service_account_path = service_account_path
         self.drive_service = None
         self.sheets_client = None
+        self._credentials = None
+        self._local = threading.local()
+        # Download totals across the run, for the throughput summary.
+        # Downloads overlap, so download_seconds is wall time from the first
+        # download's start to the last one's end, not a sum of durations.
+        self.bytes_downloaded = 0
+        self.download_seconds = 0.0
+        self._downloads_started = None
+        self._stats_lock = threading.Lock()
+        # Rows the last run could not write to the sheet, kept so the caller
+        # can retry them (SheetRowBuffer.pending after the final flush), and
+        # the CSV they were also saved to.
+        self.unflushed_rows = []
+        self.unflushed_path = None
 
     def authenticate(self):
         try:
@@ -35,23 +165,57 @@ class DriveBatchProcessor:
                 self.service_account_path, scopes=self.SCOPES)
             self.drive_service = build('drive', 'v3', credentials=creds)
             self.sheets_client = gspread.authorize(creds)
+            self._credentials = creds
             return True, "Authentication successful."
         except Exception as e:
             return False, f"Authentication failed: {e}"
 
-    def download_file(self, file_id, file_name, dest_dir):
-        """Downloads a Drive file into dest_dir with a sanitized name."""
-        request = self.drive_service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
+    def _drive(self):
+        """The Drive service for the calling thread. The service talks
+        through an httplib2.Http, which isn't thread-safe, so every stage
+        worker builds its own (with its own connection) on first use."""
+        service = getattr(self._local, "drive", None)
+        if service is None:
+            if self._credentials is None:
+                # Assigned directly rather than via authenticate() - e.g. the
+                # load test's in-memory fake - so there is nothing to rebuild.
+                service = self.drive_service
+            else:
+                service = build('drive', 'v3', credentials=self._credentials,
+                                cache_discovery=False)
+            self._local.drive = service
+        return service
+
+    def download_file(self, file_id, file_name, dest_dir, chunk_size=None):
+        """Downloads a Drive file into a new folder under dest_dir with a
+        sanitized name, streaming it to disk chunk by chunk.
 
+        Drive allows several files with the same name in one folder ("New
+        Recording.wav"), so each download gets a folder of its own rather
+        than a prefixed name - the file name is what name correction reads.
+        Remove the file with _remove_download()."""
         safe_name = re.sub(r'[\\/:*?"<>|]', '_', file_name)
-        local_path = os.path.join(dest_dir, safe_name)
-        with open(local_path, "wb") as f:
-            f.write(fh.getbuffer())
+        local_path = os.path.join(tempfile.mkdtemp(dir=dest_dir), safe_name)
+
+        request = self._drive().files().get_media(fileId=file_id)
+        with self._stats_lock:
+            if self._downloads_started is None:
+                self._downloads_started = time.monotonic()
+        try:
+            with open(local_path, "wb") as f:
+                downloader = MediaIoBaseDownload(
+                    f, request, chunksize=chunk_size or self.DOWNLOAD_CHUNK_SIZE)
+                done = False
+                while not done:
+                    _, done = downloader.next_chunk()
+        except Exception:
+            # Don't leave a truncated file behind in the temp folder.
+            _remove_download(local_path)
+            raise
+
+        with self._stats_lock:
+            self.bytes_downloaded += os.path.getsize(local_path)
+            self.download_seconds = time.monotonic() - self._downloads_started
         return local_path
 
     def update_sheet(self, sheet_id, data_row):
@@ -62,12 +226,16 @@ class DriveBatchProcessor:
         except Exception as e:
             return False, str(e)
 
-    def move_file(self, file_id, destination_folder_id):
+    def move_file(self, file_id, destination_folder_id, parents=None):
+        """Moves one file. Pass the file's current parents (as listed by
+        list_audio_files) to skip the metadata lookup."""
         try:
-            file = self.drive_service.files().get(
-                fileId=file_id, fields='parents').execute()
-            previous_parents = ",".join(file.get('parents', []))
-            self.drive_service.files().update(
+            if parents is None:
+                file = self._drive().files().get(
+                    fileId=file_id, fields='parents').execute()
+                parents = file.get('parents', [])
+            previous_parents = ",".join(parents)
+            self._drive().files().update(
                 fileId=file_id,
                 addParents=destination_folder_id,
                 removeParents=previous_parents,
@@ -76,14 +244,46 @@ class DriveBatchProcessor:
         except Exception as e:
             return False, str(e)
 
+    def move_files(self, items, destination_folder_id):
+        """Moves listed files (dicts with 'id' and 'parents') using Drive
+        batch requests. Returns [(item, ok, error), ...] in input order."""
+        errors = {}
+
+        def on_response(request_id, _response, exception):
+            if exception is not None:
+                errors[request_id] = str(exception)
+
+        drive = self._drive()
+        for start in range(0, len(items), self.MOVE_BATCH_SIZE):
+            chunk = items[start:start + self.MOVE_BATCH_SIZE]
+            batch = drive.new_batch_http_request(callback=on_response)
+            for index, item in enumerate(chunk, start=start):
+                batch.add(drive.files().update(
+                    fileId=item['id'],
+                    addParents=destination_folder_id,
+                    removeParents=",".join(item.get('parents', [])),
+                    fields='id'), request_id=str(index))
+            try:
+                batch.execute()
+            except Exception as e:
+                for index in range(start, start + len(chunk)):
+                    errors.setdefault(str(index), str(e))
+
+        return [(item, str(i) not in errors, errors.get(str(i)))
+                for i, item in enumerate(items)]
+
     def list_audio_files(self, input_folder_id):
-        query = f"'{input_folder_id}' in parents and trashed = false"
+        # Folders and native Google Docs/Sheets/etc. can never be audio, so
+        # leave them out server-side; the extension check below does the rest
+        # (Drive's audio mimeTypes are too inconsistent to filter on alone).
+        query = (f"'{input_folder_id}' in parents and trashed = false"
+                 " and not mimeType contains 'application/vnd.google-apps.'")
         files = []
         page_token = None
         while True:
-            results = self.drive_service.files().list(
-                q=query, pageToken=page_token,
-                fields="nextPageToken, files(id, name, mimeType)").execute()
+            results = self._drive().files().list(
+                q=query, pageToken=page_token, pageSize=self.LIST_PAGE_SIZE,
+                fields="nextPageToken, files(id, name, mimeType, parents)").execute()
             files.extend(results.get('files', []))
             page_token = results.get('nextPageToken')
             if not page_token:
@@ -106,40 +306,119 @@ class DriveBatchProcessor:
         log_callback(f"Found {len(audio_files)} audio files to process.")
         temp_dir = tempfile.mkdtemp(prefix="vak_")
 
-        for item in audio_files:
-            file_id, file_name = item['id'], item['name']
-            log_callback(f"Processing: {file_name}...")
+        def download(item):
+            log_callback(f"Processing: {item['name']}...")
+            started = time.monotonic()
+            try:
+                local_path = self.download_file(item['id'], item['name'], temp_dir)
+            except Exception as e:
+                log_callback(f"  - {item['name']}: download failed: {e}")
+                return None
+            size = os.path.getsize(local_path)
+            log_callback(f"  - {item['name']}: downloaded "
+                         f"{_rate(size, time.monotonic() - started)}")
+            return item, local_path
 
-            local_path = None
+        def transcribe(job):
+            item, local_path = job
             try:
-                local_path = self.download_file(file_id, file_name, temp_dir)
                 result = pipeline.process_file(local_path)
             except Exception as e:
-                log_callback(f"  - Failed: {e}")
-                continue
+                log_callback(f"  - {item['name']}: failed: {e}")
+                return None
             finally:
-                if local_path and os.path.exists(local_path):
-                    try:
-                        os.remove(local_path)
-                    except OSError:
-                        pass
+                _remove_download(local_path)
 
+            # Emitted as one call so a file's lines stay together in the log
+            # while other files are in flight.
             if result.ok:
-                log_callback(f"  - Text: {result.text}")
-                log_callback(f"  - Phonetic: {result.ipa}")
-                log_callback(f"  - Sanskrit: {result.sanskrit}")
-                log_callback(f"  - IAST: {result.iast}")
+                log_callback(f"Converted: {item['name']}\n"
+                             f"  - Text: {result.text}\n"
+                             f"  - Phonetic: {result.ipa}\n"
+                             f"  - Sanskrit: {result.sanskrit}\n"
+                             f"  - IAST: {result.iast}")
             else:
-                log_callback(f"  - {result.error}")
+                log_callback(f"  - {item['name']}: {result.error}")
+            return item, result
+
+        rows = SheetRowBuffer(self.sheets_client, sheet_id,
+                              self.SHEET_BATCH_ROWS, self.SHEET_FLUSH_SECONDS)
+        # The items whose rows are in rows.pending, in the same order. An
+        # item goes on to the move stage only once its row is in the sheet:
+        # if the sheet can't be written the file stays in the input folder
+        # and the next run picks it up again.
+        held = []
 
+        def flush_rows(final=False):
+            if not (rows.due() or final and rows.pending):
+                return None
+            attempts = self.SHEET_FLUSH_RETRIES if final else 1
+            for attempt in range(attempts):
+                ok, count, err = rows.flush()
+                if ok:
+                    log_callback(f"Sheet updated: {count} rows.")
+                    written = held[:count]
+                    del held[:count]
+                    return written
+                log_callback(f"Sheet update failed ({count} rows kept for retry): {err}")
+                if attempt + 1 < attempts:
+                    time.sleep(2 ** attempt)
+            return None
+
+        def log_row(job):
+            item, result = job
             timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            # Columns: Filename, Timestamp, Text, Phonetic, Sanskrit, IAST, IAST_Separated
-            row = [file_name, timestamp] + result.as_row()
-            ok, err = self.update_sheet(sheet_id, row)
-            log_callback("  - Sheet updated." if ok else f"  - Sheet update failed: {err}")
+            rows.add([item['name'], timestamp] + result.as_row())
+            held.append(item)
+            return flush_rows()
+
+        moves = []
+        last_move = [time.monotonic()]
+
+        def flush_moves(final=False):
+            if not moves:
+                return
+            if not (final or len(moves) >= self.MOVE_BATCH_SIZE
+                    or time.monotonic() - last_move[0] >= self.MOVE_FLUSH_SECONDS):
+                return
+            last_move[0] = time.monotonic()
+            batch = list(moves)
+            del moves[:]
+            moved = 0
+            for item, ok, err in self.move_files(batch, done_folder_id):
+                if ok:
+                    moved += 1
+                else:
+                    log_callback(f"  - {item['name']}: move failed: {err}")
+            log_callback(f"Moved {moved} of {len(batch)} files to Done folder.")
 
-            ok, err = self.move_file(file_id, done_folder_id)
-            log_callback("  - File moved to Done folder." if ok else f"  - Move failed: {err}")
+        def move(item):
+            moves.append(item)
+            flush_moves()
+
+        stages = [
+            (download, self.DOWNLOAD_WORKERS),
+            (transcribe, self.TRANSCRIBE_WORKERS),
+            (log_row, 1, flush_rows),
+            (move, 1, flush_moves),
+        ]
+        pipeline.size_speech_client(self.TRANSCRIBE_WORKERS)
+        self.bytes_downloaded = 0
+        self.download_seconds = 0.0
+        self._downloads_started = None
+        self._run_stages(audio_files, stages, log_callback)
+        self.unflushed_rows = rows.pending
+        self.unflushed_path = None
+        if rows.pending:
+            log_callback(f"{len(rows.pending)} rows could not be written to the sheet; "
+                         "their files were left in the input folder.")
+            try:
+                self.unflushed_path = self.save_rows(rows.pending)
+                log_callback(f"The unwritten rows were saved to {self.unflushed_path}")
+            except OSError as e:
+                log_callback(f"Could not save the unwritten rows: {e}")
+        if self.bytes_downloaded:
+            log_callback(f"Downloaded {_rate(self.bytes_downloaded, self.download_seconds)}")
 
         try:
             os.rmdir(temp_dir)
@@ -147,6 +426,83 @@ class DriveBatchProcessor:
             pass
         log_callback("Batch processing complete.")
 
+    def save_rows(self, rows, directory=None):
+        """Writes sheet rows to a new CSV (in the cache folder by default)
+        and returns its path."""
+        directory = directory or app_paths.cache_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory,
+                            time.strftime("unwritten_sheet_rows_%Y%m%d-%H%M%S.csv"))
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.SHEET_COLUMNS)
+            writer.writerows(rows)
+        return path
+
+    def _run_stages(self, items, stages, log_callback):
+        """Pushes items through stages [(func, workers[, flush]), ...]. Each
+        func takes the previous stage's output; returning None drops the item
+        (the stage has already logged why). A stage's optional flush() is
+        called whenever its queue sits idle for a second, and with
+        final=True once its input is exhausted - stages that batch work use
+        it to push out what they are holding. A stage with a flush holds
+        items back, so its func and flush both return a list of outputs
+        (or None) rather than a single one."""
+        queues = [queue.Queue(maxsize=self.QUEUE_SIZE) for _ in stages]
+        queues.append(None)
+        threads = []
+
+        def guarded(call, *args, **kwargs):
+            # A dead worker would stall the whole pipeline; log and keep going.
+            try:
+                return call(*args, **kwargs)
+            except Exception as e:
+                log_callback(f"  - Unexpected error: {e}")
+                return None
+
+        def worker(func, flush, in_q, out_q):
+            def send(outputs):
+                for output in outputs or ():
+                    if out_q is not None:
+                        out_q.put(output)
+
+            while True:
+                try:
+                    item = in_q.get(timeout=1.0 if flush else None)
+                except queue.Empty:
+                    send(guarded(flush))
+                    continue
+                if item is _DONE:
+                    if flush:
+                        send(guarded(flush, final=True))
+                    return
+                output = guarded(func, item)
+                send(output if flush else [output] if output is not None else None)
+
+        for index, (func, workers, *flush) in enumerate(stages):
+            flush = flush[0] if flush else None
+            stage_threads = [
+                threading.Thread(target=worker,
+                                 args=(func, flush, queues[index], queues[index + 1]),
+                                 daemon=True)
+                for _ in range(workers)]
+            for t in stage_threads:
+                t.start()
+            threads.append(stage_threads)
+
+        # put() blocks while the first queue is full - that is the
+        # back-pressure that bounds downloads in flight.
+        for item in items:
+            queues[0].put(item)
+
+        # Shut the stages down front to back: once every worker of a stage
+        # has exited, nothing more can reach the next one.
+        for index, stage_threads in enumerate(threads):
+            for _ in stage_threads:
+                queues[index].put(_DONE)
+            for t in stage_threads:
+                t.join()
+
 
 # Backwards-compatible alias for the pre-refactor class name.
 BatchProcessor = DriveBatchProcessor
@@ -0,0 +1,51 @@
+"""Compact in-memory store for the GUI's result list.
+
+A PipelineResult dataclass carries a per-instance __dict__, which adds up
+over a 100k-file run. The store keeps each result as a plain tuple of its
+field values instead and rebuilds the dataclass only when one is asked for
+(the detail window, the export).
+"""
+import dataclasses
+
+from pipeline import PipelineResult
+
+_FIELDS = tuple(f.name for f in dataclasses.fields(PipelineResult))
+
+
+class ResultStore:
+    def __init__(self):
+        self._rows = []
+        self.failed = 0
+
+    def append(self, result):
+        """Stores result and returns its index."""
+        self._rows.append(tuple(getattr(result, name) for name in _FIELDS))
+        if not result.ok:
+            self.failed += 1
+        return len(self._rows) - 1
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __bool__(self):
+        return bool(self._rows)
+
+    def __getitem__(self, index):
+        return PipelineResult(*self._rows[index])
+
+    def __iter__(self):
+        for row in self._rows:
+            yield PipelineResult(*row)
+
+    def snapshot(self):
+        """A frozen copy for a background reader (the export) while new
+        results keep arriving. Cheap: only the list of row tuples is
+        copied, not the rows."""
+        copy = ResultStore()
+        copy._rows = list(self._rows)
+        copy.failed = self.failed
+        return copy
+
+    def clear(self):
+        self._rows.clear()
+        self.failed = 0
@@ -0,0 +1,81 @@
+"""Streaming CSV / JSONL output for pipeline results.
+
+Shared by the GUI export and the headless batch mode so both write the same
+columns. Each result is written as soon as it is handed over; nothing is
+collected in memory first.
+"""
+import csv
+import dataclasses
+import json
+
+COLUMNS = ["File", "Status", "Transcription", "IPA", "Sanskrit", "IAST",
+           "IAST (separated)", "Speech API heard"]
+
+FORMATS = ("csv", "jsonl")
+
+
+def status_text(result):
+    """The Status column: OK, OK (name-corrected) or Failed."""
+    if not result.ok:
+        return "Failed"
+    return "OK (name-corrected)" if result.corrected_from else "OK"
+
+
+def result_row(result):
+    """A PipelineResult as values in COLUMNS order. "Speech API heard" is
+    the raw transcript when name correction replaced it, else empty."""
+    if result.ok:
+        return [result.file_name, status_text(result), result.text, result.ipa,
+                result.sanskrit, result.iast, result.iast_separated,
+                result.corrected_from]
+    return [result.file_name, "Failed", result.error, "", "", "", "", ""]
+
+
+def format_for(path):
+    """'jsonl' for .jsonl/.json paths, 'csv' for everything else."""
+    return "jsonl" if path.lower().endswith((".jsonl", ".json")) else "csv"
+
+
+class ResultWriter:
+    """Writes results to path one at a time. CSV gets a header row and a
+    UTF-8 BOM so Excel renders Devanagari and IAST diacritics; JSONL gets
+    one object per line with every PipelineResult field."""
+
+    def __init__(self, path, fmt=None):
+        self.format = fmt or format_for(path)
+        if self.format not in FORMATS:
+            raise ValueError(f"Unknown export format: {self.format}")
+        self.count = 0
+        if self.format == "csv":
+            self._file = open(path, "w", newline="", encoding="utf-8-sig")
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(COLUMNS)
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, result):
+        if self.format == "csv":
+            self._csv.writerow(result_row(result))
+        else:
+            self._file.write(json.dumps(dataclasses.asdict(result), ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def write_many(self, results):
+        """Writes a chunk of results in one call."""
+        if self.format == "csv":
+            rows = [result_row(r) for r in results]
+            self._csv.writerows(rows)
+        else:
+            rows = [json.dumps(dataclasses.asdict(r), ensure_ascii=False) + "\n"
+                    for r in results]
+            self._file.write("".join(rows))
+        self.count += len(rows)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
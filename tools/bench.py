@@ -0,0 +1,234 @@
+"""Micro-benchmarks for the text hot paths.
+
+Times ipa_map, name_correction and the text stage of the pipeline on fixed
+corpora - single words, sentences and long transcripts - and reports
+operations per second plus the memory each round allocates (tracemalloc
+peak and blocks still held afterwards). Results can be saved as a JSON
+baseline and later runs compared against it:
+
+    python tools/bench.py --save bench_baseline.json
+    python tools/bench.py --compare bench_baseline.json
+
+A comparison flags every case that got slower, or allocates more, by more
+than --tolerance, and exits with status 1 if any did.
+
+The corpora are generated from a fixed seed, so numbers are comparable
+between runs and commits. Caches (the word cache, Metaphone memo, ...) are
+cleared before every round: a round models a fresh batch, in which words
+repeat within the batch but nothing is carried over from the last one.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+# The app modules live one directory up.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ipa_map
+import lexicon
+import name_correction
+import pipeline
+
+SEED = 1729
+
+# Vocabulary the corpora are drawn from: everyday English plus the kind of
+# names and Sanskrit loanwords the speech API hears in Vak's recordings.
+_VOCABULARY = """
+the of and to in is that it was for on are with as his they be at one have
+this from or had by word but what some we can out other were all there when
+up use your how said an each she which do their time if will way about many
+then them write would like so these her long make thing see him two has look
+more day could go come did number sound no most people my over know water
+than call first who may down side been now find yoga bhakti karma dharma
+mantra krishna rama sita shiva ganesh lakshmi guru ashram meditation breath
+chant lotus temple devotion practice teacher student lesson morning evening
+kristen ann beifus maria garcia james oliver priya sharma arjun patel
+""".split()
+
+_NAMES = ["Kristen Ann Beifus", "Maria Garcia", "James Oliver", "Priya Sharma",
+          "Arjun Patel", "Bhakti Yoga", "Shiva Temple", "Lakshmi Puja",
+          "Ganesh Chaturthi", "Rama Navami", "Sita Devi", "Krishna Das"]
+
+# What the speech API tends to hear for each name: soundalike common words.
+_MISHEARD = {"Kristen Ann Beifus": "Kristen Anne by Fitz", "Maria Garcia": "Mariah garcia",
+             "James Oliver": "James all over", "Priya Sharma": "pria charma",
+             "Arjun Patel": "our June patel", "Bhakti Yoga": "bucky yoga",
+             "Shiva Temple": "she va temple", "Lakshmi Puja": "lock me pooja",
+             "Ganesh Chaturthi": "go nesh chat irthi", "Rama Navami": "Rama navy me",
+             "Sita Devi": "see ta Davy", "Krishna Das": "Krishna does"}
+
+
+def _texts(rng, count, words_per_text):
+    return [" ".join(rng.choice(_VOCABULARY) for _ in range(words_per_text))
+            for _ in range(count)]
+
+
+def build_corpora():
+    """name -> list of English texts. Fixed for a given SEED."""
+    rng = random.Random(SEED)
+    return {
+        "word": _texts(rng, 500, 1),
+        "sentence": _texts(rng, 200, 12),
+        "transcript": _texts(rng, 20, 400),
+    }
+
+
+def build_pairs():
+    """(transcript, path) pairs for name correction: mis-hearings of the
+    filename, exact matches, unrelated filenames and unusable ones."""
+    rng = random.Random(SEED)
+    pairs = []
+    for i in range(400):
+        name = rng.choice(_NAMES)
+        kind = i % 4
+        if kind == 0:
+            pairs.append((_MISHEARD[name], f"{name}.wav"))
+        elif kind == 1:
+            pairs.append((name.lower(), f"{name} (1).mp3"))
+        elif kind == 2:
+            pairs.append((_MISHEARD[name], f"New Recording {i}.m4a"))
+        else:
+            pairs.append((" ".join(rng.choice(_VOCABULARY) for _ in range(6)), "01.wav"))
+    return pairs
+
+
+def _clear_caches():
+    ipa_map._split_piece.cache_clear()
+    pipeline.clear_word_cache()
+    name_correction._phonetic.cache_clear()
+    name_correction._usable_stem.cache_clear()
+
+
+def build_cases():
+    """(case name, function, inputs). One operation is one call of
+    function on one input; a round is one pass over the inputs."""
+    corpora = build_corpora()
+    cases = []
+    for size, texts in corpora.items():
+        # Inputs for the later stages are derived once, outside the timing.
+        ipas = [" ".join(lexicon.ipa_many(t.split())).translate(pipeline._IPA_NOISE)
+                for t in texts]
+        sanskrit = [ipa_map.ipa_to_sanskrit(ipa) for ipa in ipas]
+        iast = [ipa_map.sanskrit_to_iast(text) for text in sanskrit]
+        cases += [
+            (f"ipa_to_sanskrit/{size}", ipa_map.ipa_to_sanskrit, ipas),
+            (f"sanskrit_to_iast/{size}", ipa_map.sanskrit_to_iast, sanskrit),
+            (f"get_iast_separated/{size}", ipa_map.get_iast_separated, iast),
+            (f"text_stage/{size}", lambda text: pipeline.convert_texts([text]), texts),
+        ]
+    pairs = build_pairs()
+    cases.append(("correct_transcript/pairs",
+                  lambda pair: name_correction.correct_transcript(*pair), pairs))
+    cases.append(("correct_transcripts/batch400",
+                  name_correction.correct_transcripts, [pairs]))
+    return cases
+
+
+def _round(function, inputs):
+    _clear_caches()
+    started = time.perf_counter()
+    for item in inputs:
+        function(item)
+    return time.perf_counter() - started
+
+
+def run_case(function, inputs, min_seconds=0.5, min_rounds=5):
+    """Timing and allocation figures for one case."""
+    _round(function, inputs)  # imports, lazily built tables, lexicon pages
+    times = []
+    deadline = time.perf_counter() + min_seconds
+    while len(times) < min_rounds or time.perf_counter() < deadline:
+        times.append(_round(function, inputs))
+    best = min(times)
+    median = statistics.median(times)
+
+    # A separate round for allocations: tracing slows the code down.
+    _clear_caches()
+    tracemalloc.start()
+    before_blocks = sys.getallocatedblocks()
+    tracemalloc.reset_peak()
+    start_size, _ = tracemalloc.get_traced_memory()
+    for item in inputs:
+        function(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = sys.getallocatedblocks() - before_blocks
+
+    return {
+        "ops": len(inputs),
+        "rounds": len(times),
+        "ops_per_sec": len(inputs) / median,
+        "best_ops_per_sec": len(inputs) / best,
+        "peak_kib_per_round": (peak - start_size) / 1024,
+        "retained_blocks": retained,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Names of cases that regressed against baseline, with a reason."""
+    regressions = []
+    for name, now in results.items():
+        then = baseline.get("results", {}).get(name)
+        if then is None:
+            continue
+        # The best round is the least disturbed by whatever else the machine
+        # is doing, so it is what gets compared.
+        if now["best_ops_per_sec"] < then["best_ops_per_sec"] * (1 - tolerance):
+            regressions.append((name, f"best ops/sec {then['best_ops_per_sec']:.0f} -> "
+                                      f"{now['best_ops_per_sec']:.0f}"))
+        # Tiny allocations are noise; only flag growth past 64 KiB.
+        if now["peak_kib_per_round"] > max(then["peak_kib_per_round"] * (1 + tolerance),
+                                           then["peak_kib_per_round"] + 64):
+            regressions.append((name, f"peak KiB {then['peak_kib_per_round']:.0f} -> "
+                                      f"{now['peak_kib_per_round']:.0f}"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="",
+                        help="only run cases whose name contains this text")
+    parser.add_argument("--seconds", type=float, default=0.5,
+                        help="minimum timing per case (default 0.5)")
+    parser.add_argument("--save", metavar="JSON", help="write results as a baseline")
+    parser.add_argument("--compare", metavar="JSON", help="flag regressions against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed slowdown / allocation growth (default 0.15)")
+    args = parser.parse_args()
+
+    lexicon.get_lexicon()  # build it now rather than inside the first case
+    results = {}
+    print(f"{'case':34} {'ops/sec':>12} {'best':>12} {'peak KiB':>10} {'retained':>9}")
+    for name, function, inputs in build_cases():
+        if args.filter not in name:
+            continue
+        r = run_case(function, inputs, args.seconds)
+        results[name] = r
+        print(f"{name:34} {r['ops_per_sec']:12.0f} {r['best_ops_per_sec']:12.0f} "
+              f"{r['peak_kib_per_round']:10.1f} {r['retained_blocks']:9d}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "seed": SEED, "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, reason in regressions:
+            print(f"REGRESSION {name}: {reason}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
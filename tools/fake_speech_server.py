@@ -0,0 +1,126 @@
+"""Local stand-in for the Google Web Speech endpoint.
+
+Answers every POST with a canned transcript in the API's own response
+format, so the pipeline can be exercised and benchmarked offline:
+
+    python tools/fake_speech_server.py --port 8765 --text "bhakti yoga"
+    VAK_SPEECH_ENDPOINT=http://127.0.0.1:8765/recognize python main.py
+
+Latency can be fixed or drawn from a uniform or exponential distribution
+around the given mean, and a share of requests can be answered with
+errors (429/503 by default, which SpeechClient retries) to rehearse load
+against a struggling service:
+
+    python tools/fake_speech_server.py --latency 0.4 --latency-dist exponential \
+        --error-rate 0.05
+
+Transcripts produced against a stand-in endpoint are cached under their own
+key (see SpeechClient.cache_tag), so they never mix with real ones.
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+
+
+def sample_latency(mean, dist="fixed"):
+    """Seconds to wait before answering: exactly mean, uniform on
+    [0, 2 * mean], or exponential with that mean."""
+    if mean <= 0:
+        return 0.0
+    if dist == "uniform":
+        return random.uniform(0, 2 * mean)
+    if dist == "exponential":
+        return random.expovariate(1 / mean)
+    return mean
+
+
+class FakeSpeechHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive, like the real API.
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        # The body must be drained for the connection to be reusable.
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        delay = sample_latency(server.latency, server.latency_dist)
+        if delay:
+            time.sleep(delay)
+        failed = server.error_rate and random.random() < server.error_rate
+        with server.stats_lock:
+            server.requests += 1
+            server.errors += bool(failed)
+        if failed:
+            body = b"simulated failure"
+            self.send_response(random.choice(server.error_statuses))
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        result = {"alternative": [{"transcript": self.server.text, "confidence": 0.9}],
+                  "final": True}
+        body = (json.dumps({"result": []}) + "\n"
+                + json.dumps({"result": [result], "result_index": 0}) + "\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # one line per request drowns out everything else
+
+
+def serve(port=0, text="hello world", latency=0.0, latency_dist="fixed",
+          error_rate=0.0, error_statuses=(429, 503)):
+    """Starts the server on a background thread and returns it; the
+    endpoint URL is f"http://127.0.0.1:{server.server_port}/recognize".
+    server.requests and server.errors count what it has answered. Call
+    server.shutdown() to stop it."""
+    if latency_dist not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {latency_dist}")
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeSpeechHandler)
+    server.daemon_threads = True
+    server.text = text
+    server.latency = latency
+    server.latency_dist = latency_dist
+    server.error_rate = error_rate
+    server.error_statuses = tuple(error_statuses)
+    server.stats_lock = Lock()
+    server.requests = 0
+    server.errors = 0
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--text", default="hello world",
+                        help="transcript returned for every request")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="(mean) seconds to wait before answering")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="fixed",
+                        help="how the wait varies around --latency (default fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests answered with an error status")
+    parser.add_argument("--error-status", type=int, action="append",
+                        help="status code(s) to fail with (default 429 and 503)")
+    args = parser.parse_args()
+    server = serve(args.port, args.text, args.latency, args.latency_dist,
+                   args.error_rate, args.error_status or (429, 503))
+    print(f"Fake speech endpoint: http://127.0.0.1:{server.server_port}/recognize")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
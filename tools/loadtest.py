@@ -0,0 +1,412 @@
+"""Offline end-to-end load test.
+
+Generates a corpus of synthetic recordings (WAV, plus MP3 when ffmpeg is
+available), starts the stand-in speech endpoint from fake_speech_server.py
+and pushes the corpus through the real pipeline at several concurrency
+levels, reporting throughput, per-file latency percentiles and peak RSS:
+
+    python tools/loadtest.py --files 200 --concurrency 1,4,8,16 \\
+        --latency 0.3 --latency-dist exponential --error-rate 0.02
+
+--mode files runs pipeline.process_file on a thread pool, like the local
+tab and the batch CLI. --mode drive runs DriveBatchProcessor.process_folder
+against in-memory Drive and Sheets fakes (with their own simulated
+latency), varying TRANSCRIBE_WORKERS; a file's latency there runs from the
+start of its download to its move into the Done folder.
+
+The transcript cache is switched off so every file reaches the endpoint.
+Peak RSS is the process high-water mark (the peak working set on
+Windows), so levels are run from low to high concurrency and each figure
+is the peak up to and including that level.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# The app modules live one directory up; the fake server lives alongside.
+_TOOLS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_TOOLS))
+sys.path.insert(0, _TOOLS)
+
+os.environ["VAK_NO_TRANSCRIPT_CACHE"] = "1"
+
+import fake_speech_server
+import pipeline
+import speech_client
+
+SEED = 4242
+SAMPLE_RATE = 48000
+
+
+# ---------------------------------------------------------------------- #
+# Synthetic corpus
+# ---------------------------------------------------------------------- #
+def _speechlike(rng, seconds):
+    """16-bit mono PCM of syllable-length tone bursts separated by short
+    pauses - loud enough to pass pre-screening, with quiet gaps for the
+    chunker to cut at."""
+    samples = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    pos = int(rng.uniform(0.1, 0.3) * SAMPLE_RATE)
+    while pos < len(samples):
+        length = int(rng.uniform(0.1, 0.35) * SAMPLE_RATE)
+        t = np.arange(min(length, len(samples) - pos)) / SAMPLE_RATE
+        envelope = np.sin(np.pi * t / (length / SAMPLE_RATE))
+        tone = np.sin(2 * np.pi * rng.uniform(120, 320) * t) * envelope
+        samples[pos:pos + len(t)] = 0.4 * tone
+        pos += len(t) + int(rng.uniform(0.05, 0.6) * SAMPLE_RATE)
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+def make_corpus(directory, count, mp3_share=0.25, long_share=0.05):
+    """Writes count recordings into directory: mostly 2-10 s clips, with
+    long_share of 60-150 s lectures that get split into several chunks.
+    mp3_share of them are MP3 if ffmpeg is available. Returns the paths."""
+    rng = random.Random(SEED)
+    ffmpeg = (pipeline._ffmpeg_path or "ffmpeg") if pipeline.ffmpeg_available() else None
+    paths = []
+    for i in range(count):
+        seconds = rng.uniform(60, 150) if rng.random() < long_share else rng.uniform(2, 10)
+        wav_path = os.path.join(directory, f"recording_{i:05d}.wav")
+        with wave.open(wav_path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(SAMPLE_RATE)
+            w.writeframes(_speechlike(rng, seconds))
+        if ffmpeg and rng.random() < mp3_share:
+            mp3_path = wav_path[:-4] + ".mp3"
+            subprocess.run([ffmpeg, "-nostdin", "-v", "error", "-y", "-i", wav_path,
+                            "-b:a", "64k", mp3_path], check=True)
+            os.remove(wav_path)
+            paths.append(mp3_path)
+        else:
+            paths.append(wav_path)
+    return paths
+
+
+# ---------------------------------------------------------------------- #
+# Drive / Sheets fakes
+# ---------------------------------------------------------------------- #
+class _Response(dict):
+    """The bits of httplib2.Response that MediaIoBaseDownload reads."""
+
+    def __init__(self, status, headers):
+        super().__init__(headers)
+        self.status = status
+
+
+class _FakeHttp:
+    def __init__(self, drive, file_id):
+        self.drive = drive
+        self.file_id = file_id
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        self.drive.delay()
+        data = self.drive.content(self.file_id)
+        start, end = (int(x) for x in headers["range"][len("bytes="):].split("-"))
+        chunk = data[start:end + 1]
+        return _Response(206, {"content-range": f"bytes {start}-{start + len(chunk) - 1}"
+                                                f"/{len(data)}"}), chunk
+
+
+class _FakeCall:
+    """A prepared API call; execute() runs it."""
+
+    def __init__(self, run, uri="", http=None):
+        self._run = run
+        self.uri = uri
+        self.http = http
+        self.headers = {}
+
+    def execute(self):
+        return self._run()
+
+
+class _FakeFiles:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q, pageToken=None, pageSize=100, fields=None):
+        folder = q.split("'")[1]
+
+        def run():
+            self.drive.delay()
+            with self.drive.lock:
+                ids = sorted(i for i, f in self.drive.items.items() if folder in f["parents"])
+            start = int(pageToken or 0)
+            page = [dict(self.drive.items[i], id=i) for i in ids[start:start + pageSize]]
+            result = {"files": page}
+            if start + pageSize < len(ids):
+                result["nextPageToken"] = str(start + pageSize)
+            return result
+        return _FakeCall(run)
+
+    def get_media(self, fileId):
+        self.drive.started(fileId)
+        return _FakeCall(None, f"fake://drive/{fileId}", _FakeHttp(self.drive, fileId))
+
+    def get(self, fileId, fields=None):
+        return _FakeCall(lambda: {"parents": list(self.drive.items[fileId]["parents"])})
+
+    def update(self, fileId, addParents, removeParents, fields=None):
+        def run():
+            self.drive.move(fileId, addParents, removeParents)
+            return {"id": fileId}
+        return _FakeCall(run)
+
+
+class _FakeBatch:
+    def __init__(self, drive, callback):
+        self.drive = drive
+        self.callback = callback
+        self.calls = []
+
+    def add(self, call, request_id):
+        self.calls.append((request_id, call))
+
+    def execute(self):
+        self.drive.delay()  # one round trip for the whole batch
+        for request_id, call in self.calls:
+            self.callback(request_id, call.execute(), None)
+
+
+class FakeDrive:
+    """In-memory stand-in for the Drive v3 service object, serving local
+    files as if they were in folder 'input'. Records when each file's
+    download started and when it was moved, for end-to-end latency."""
+
+    def __init__(self, paths, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.items = {f"id{i}": {"name": os.path.basename(p), "parents": ["input"],
+                                 "mimeType": "audio/wav", "path": p}
+                      for i, p in enumerate(paths)}
+        self.started_at = {}
+        self.latencies = []
+
+    def delay(self):
+        if self.latency:
+            time.sleep(fake_speech_server.sample_latency(self.latency, "exponential"))
+
+    def content(self, file_id):
+        with open(self.items[file_id]["path"], "rb") as f:
+            return f.read()
+
+    def started(self, file_id):
+        with self.lock:
+            self.started_at[file_id] = time.perf_counter()
+
+    def move(self, file_id, add, remove):
+        with self.lock:
+            parents = self.items[file_id]["parents"]
+            parents[:] = [p for p in parents if p not in remove.split(",")] + [add]
+            if file_id in self.started_at:
+                self.latencies.append(time.perf_counter() - self.started_at[file_id])
+
+    def files(self):
+        return _FakeFiles(self)
+
+    def new_batch_http_request(self, callback):
+        return _FakeBatch(self, callback)
+
+
+class FakeSheets:
+    """Stand-in for an authorized gspread client; counts appended rows and
+    how many of them are successful conversions."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rows = 0
+        self.ok_rows = 0
+        self.sheet1 = self
+
+    def open_by_key(self, key):
+        return self
+
+    def append_rows(self, rows):
+        if self.latency:
+            time.sleep(fake_speech_server.sample_latency(self.latency, "exponential"))
+        self.rows += len(rows)
+        # Failed files log "[error]" in the Text column (PipelineResult.as_row).
+        self.ok_rows += sum(1 for row in rows if not row[2].startswith("["))
+
+
+# ---------------------------------------------------------------------- #
+# Runs
+# ---------------------------------------------------------------------- #
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(p / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _peak_rss_mib():
+    """The process's peak resident set size in MiB, or None if it can't be
+    read on this platform."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes.
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    if sys.platform == "win32":
+        return _peak_working_set_mib()
+    return None
+
+
+def _peak_working_set_mib():
+    """Windows' equivalent of peak RSS, from GetProcessMemoryInfo."""
+    import ctypes
+    from ctypes import wintypes
+
+    class Counters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = Counters()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi = ctypes.WinDLL("psapi")
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(Counters),
+                                           wintypes.DWORD]
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(),
+                                      ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize / (1024 * 1024)
+
+
+def _format_mib(value):
+    return "n/a" if value is None else f"{value:.0f}"
+
+
+def run_files(paths, concurrency):
+    """(ok, failed, latencies) for process_file over paths."""
+    def timed(path):
+        started = time.perf_counter()
+        result = pipeline.process_file(path)
+        return result.ok, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, paths))
+    ok = sum(1 for good, _ in outcomes if good)
+    return ok, len(outcomes) - ok, [seconds for _, seconds in outcomes]
+
+
+def run_drive(paths, concurrency, drive_latency):
+    import processor
+    drive = FakeDrive(paths, drive_latency)
+    sheets = FakeSheets(drive_latency)
+    batch = processor.DriveBatchProcessor("unused.json")
+    batch.drive_service = drive
+    batch.sheets_client = sheets
+    batch.TRANSCRIBE_WORKERS = concurrency
+    batch.QUEUE_SIZE = max(processor.DriveBatchProcessor.QUEUE_SIZE, 2 * concurrency)
+    # Flush promptly so the last files' latency isn't the flush timer.
+    batch.MOVE_FLUSH_SECONDS = 0.5
+    batch.process_folder("input", "done", "sheet", lambda msg: None)
+    return sheets.ok_rows, len(paths) - sheets.ok_rows, drive.latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("files", "drive"), default="files")
+    parser.add_argument("--files", type=int, default=100, help="corpus size (default 100)")
+    parser.add_argument("--corpus", help="reuse (or create) the corpus in this directory")
+    parser.add_argument("--mp3-share", type=float, default=0.25,
+                        help="share of the corpus encoded as MP3 (default 0.25)")
+    parser.add_argument("--long-share", type=float, default=0.05,
+                        help="share of 1-2.5 minute recordings (default 0.05)")
+    parser.add_argument("--concurrency", default="1,4,8",
+                        help="comma-separated worker counts to run (default 1,4,8)")
+    parser.add_argument("--latency", type=float, default=0.3,
+                        help="mean speech endpoint latency in seconds (default 0.3)")
+    parser.add_argument("--latency-dist", choices=fake_speech_server.LATENCY_DISTRIBUTIONS,
+                        default="exponential")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of speech requests failed with 429/503")
+    parser.add_argument("--drive-latency", type=float, default=0.05,
+                        help="mean Drive/Sheets call latency in drive mode (default 0.05)")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="vak_load_")
+    os.makedirs(corpus_dir, exist_ok=True)
+    paths = sorted(os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir)
+                   if pipeline.is_supported(name))[:args.files]
+    if len(paths) < args.files:
+        print(f"Generating {args.files} recordings in {corpus_dir}...", file=sys.stderr)
+        for path in paths:
+            os.remove(path)
+        paths = make_corpus(corpus_dir, args.files, args.mp3_share, args.long_share)
+
+    server = fake_speech_server.serve(latency=args.latency, latency_dist=args.latency_dist,
+                                      error_rate=args.error_rate)
+    endpoint = f"http://127.0.0.1:{server.server_port}/recognize"
+    pipeline.warm_up()
+
+    rows = []
+    print(f"{'workers':>7} {'ok':>6} {'failed':>6} {'seconds':>8} {'files/s':>8} "
+          f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'RSS MiB':>8} {'requests':>8} {'errors':>6}")
+    try:
+        for workers in levels:
+            # A fresh client per level, with a connection per request in
+            # flight, so levels don't share warmed-up connections.
+            pipeline.set_speech_client(speech_client.SpeechClient(
+                endpoint=endpoint, pool_size=max(16, workers * pipeline.CHUNK_WORKERS)))
+            requests_before, errors_before = server.requests, server.errors
+            started = time.perf_counter()
+            if args.mode == "files":
+                ok, failed, latencies = run_files(paths, workers)
+            else:
+                ok, failed, latencies = run_drive(paths, workers, args.drive_latency)
+            elapsed = time.perf_counter() - started
+            latencies.sort()
+            row = {"workers": workers, "ok": ok, "failed": failed, "seconds": elapsed,
+                   "files_per_sec": len(paths) / elapsed,
+                   "p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                   "p99": percentile(latencies, 99), "peak_rss_mib": _peak_rss_mib(),
+                   "requests": server.requests - requests_before,
+                   "errors": server.errors - errors_before}
+            rows.append(row)
+            print(f"{workers:7d} {ok:6d} {failed:6d} {elapsed:8.1f} {row['files_per_sec']:8.2f} "
+                  f"{row['p50']:7.2f} {row['p95']:7.2f} {row['p99']:7.2f} "
+                  f"{_format_mib(row['peak_rss_mib']):>8} {row['requests']:8d} "
+                  f"{row['errors']:6d}")
+    finally:
+        server.shutdown()
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "files": len(paths), "latency": args.latency,
+                       "latency_dist": args.latency_dist, "error_rate": args.error_rate,
+                       "levels": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
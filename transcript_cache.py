@@ -0,0 +1,119 @@
+"""Persistent cache of speech-API transcripts.
+
+Re-running a Drive folder or re-dropping the same files would otherwise
+send byte-identical audio to the speech API again. Transcripts are stored
+in a small SQLite file in the per-user cache folder (app_paths), keyed by
+a SHA-256 of the audio file's bytes plus the recognizer settings, so a hit
+skips decoding and the network entirely. Only the raw transcript is
+stored - filename correction and the text stage are cheap and always
+re-run.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import app_paths
+
+_DEFAULT_PATH = app_paths.cache_path("transcripts.db")
+
+# Total transcript text kept before the least recently used entries are
+# evicted. Transcripts are short, so this holds a very large number of files.
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def content_key(path, settings=""):
+    """SHA-256 of the file's bytes and the settings string, as hex."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    digest.update(b'\0' + settings.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """Thread-safe transcript store. Any database error disables the cache
+    for the rest of the session rather than failing the file - like the
+    history file, it is a convenience."""
+
+    def __init__(self, path=_DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total_bytes = None
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                " key TEXT PRIMARY KEY, transcript TEXT NOT NULL,"
+                " size INTEGER NOT NULL, used REAL NOT NULL)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS transcripts_used ON transcripts (used)")
+            self._total_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        return self._conn
+
+    def get(self, key):
+        """The cached transcript for key, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            try:
+                db = self._db()
+                row = db.execute(
+                    "SELECT transcript FROM transcripts WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                with db:
+                    db.execute("UPDATE transcripts SET used = ? WHERE key = ?",
+                               (time.time(), key))
+                return row[0]
+            except (sqlite3.Error, OSError):
+                self.enabled = False
+                return None
+
+    def put(self, key, transcript):
+        if not self.enabled:
+            return
+        size = len(transcript.encode('utf-8'))
+        with self._lock:
+            try:
+                db = self._db()
+                with db:
+                    old = db.execute(
+                        "SELECT size FROM transcripts WHERE key = ?", (key,)).fetchone()
+                    db.execute(
+                        "INSERT OR REPLACE INTO transcripts (key, transcript, size, used)"
+                        " VALUES (?, ?, ?, ?)", (key, transcript, size, time.time()))
+                    self._total_bytes += size - (old[0] if old else 0)
+                    if self._total_bytes > self.max_bytes:
+                        self._evict(db)
+            except (sqlite3.Error, OSError):
+                self.enabled = False
+
+    def _evict(self, db):
+        """Drops least recently used entries until under max_bytes."""
+        doomed = []
+        for key, size in db.execute("SELECT key, size FROM transcripts ORDER BY used"):
+            if self._total_bytes <= self.max_bytes:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+        db.executemany("DELETE FROM transcripts WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._lock:
+            try:
+                db = self._db()
+                with db:
+                    db.execute("DELETE FROM transcripts")
+                self._total_bytes = 0
+            except (sqlite3.Error, OSError):
+                pass
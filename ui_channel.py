@@ -0,0 +1,67 @@
+"""Worker-thread -> Tk main loop message channel.
+
+Workers put() tuples like ("result", result, i) from any thread. Instead of
+the GUI polling a queue on a timer, the first message after the GUI has
+caught up generates a virtual event that wakes the Tk loop; later messages
+ride along until the GUI takes them. On top of that:
+
+  * "status" messages are coalesced - only the latest one is kept, since
+    each replaces the previous text anyway;
+  * "drive_log" lines are batched so the GUI can append them to the log
+    widget in one insert;
+  * everything else is delivered in order.
+"""
+import threading
+from collections import deque
+from tkinter import TclError
+
+
+class UiChannel:
+    EVENT = "<<VakUpdate>>"
+
+    def __init__(self, root):
+        self._root = root
+        self._lock = threading.Lock()
+        self._messages = deque()
+        self._status = None
+        self._log_lines = []
+        # True while an event is on its way or the GUI still has messages
+        # to take; puts in that window don't need to wake it again.
+        self._signaled = False
+
+    def put(self, msg):
+        with self._lock:
+            if msg[0] == "status":
+                self._status = msg[1]
+            elif msg[0] == "drive_log":
+                self._log_lines.append(msg[1])
+            else:
+                self._messages.append(msg)
+            if self._signaled:
+                return
+            self._signaled = True
+        try:
+            # Safe from worker threads: tkinter hands the call over to the
+            # thread running the Tcl interpreter.
+            self._root.event_generate(self.EVENT, when="tail")
+        except (RuntimeError, TclError):
+            # Window closed, or the main loop isn't running (yet). No event
+            # is on its way, so the next put() must try again.
+            with self._lock:
+                self._signaled = False
+
+    def take(self, limit):
+        """Returns (messages, latest_status_or_None, log_lines), with at
+        most limit ordered messages. Call pending() afterwards to see
+        whether another round is needed."""
+        with self._lock:
+            messages = [self._messages.popleft()
+                        for _ in range(min(limit, len(self._messages)))]
+            status, self._status = self._status, None
+            log_lines, self._log_lines = self._log_lines, []
+            self._signaled = bool(self._messages)
+        return messages, status, log_lines
+
+    def pending(self):
+        with self._lock:
+            return bool(self._messages)